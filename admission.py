@@ -0,0 +1,277 @@
+"""
+Admission control for the webhook routes, shared by every gunicorn worker.
+
+When a Wati broadcast lands, every recipient replies at once. Sync workers would
+queue those requests until the proxy times out. Instead, each /get-price or
+/get-prices request first passes three checks, and any request that fails gets
+an immediate answer with a Retry-After header:
+
+  * queue time: a request that waited longer than ADMISSION_MAX_QUEUE_MS
+    (1.5 s) between the router (X-Request-Start, set by Heroku and nginx) and
+    the worker is answered with 503. The client is probably about to give up
+    on it. Under sync and gthread workers this is the check that sees the
+    backlog, since requests queue in front of the threads.
+  * concurrency: past ADMISSION_MAX_IN_FLIGHT requests in progress across all
+    workers, new ones get 503. gunicorn.conf.py sets it to workers x threads,
+    which a gthread server can never exceed; it bounds worker classes that
+    take on more (gevent, uvicorn workers). Elsewhere it defaults to 64.
+  * per-client rate: one token bucket per sender (ADMISSION_CLIENT_RATE
+    requests a second, bursts of ADMISSION_CLIENT_BURST). An empty bucket
+    gets 429. The sender comes from the X-Client-Id header or the
+    ADMISSION_CLIENT_FIELD of the JSON body (Wati's waId). The client IP is
+    used only with ADMISSION_KEY_BY_IP=1, because Wati relays every chat from
+    a handful of addresses.
+
+State lives in one mmap'd file, METRICS_DIR/admission.metrics, so all workers
+see the same in-flight counts and buckets. Each worker owns a slot of doubles
+(pid, in flight, admitted and shed counts, queue wait) and is the only writer
+to it. The total in flight is the sum of the slots, and a
+request is checked against it and counted under an fcntl lock on the slots,
+so two workers can't both take the last place. A worker clears its slot
+when it exits, and slots of workers that died are cleared by the next worker
+to claim one, so like the metrics (see metrics.ProcessFile) the counters
+cover live workers only. Buckets are shared, so a
+bucket is read and updated under an fcntl lock on its 16 bytes: two syscalls,
+and only for requests that name a client. Clients hash into CLIENT_BUCKETS
+buckets, so a rare collision makes two senders share a bucket.
+"""
+
+import fcntl
+import math
+import os
+import time
+import zlib
+from array import array
+from mmap import mmap
+
+from metrics import MAPPED_PATHS, METRICS_DIR, ProcessFile, escape, format_value, process_alive
+
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 64))
+ADMISSION_MAX_QUEUE_MS = float(os.environ.get('ADMISSION_MAX_QUEUE_MS', 1500))
+ADMISSION_CLIENT_RATE = float(os.environ.get('ADMISSION_CLIENT_RATE', 5))
+ADMISSION_CLIENT_BURST = float(os.environ.get('ADMISSION_CLIENT_BURST', 20))
+ADMISSION_CLIENT_FIELD = os.environ.get('ADMISSION_CLIENT_FIELD', 'waId')
+ADMISSION_KEY_BY_IP = os.environ.get('ADMISSION_KEY_BY_IP', '').lower() in ('1', 'true', 'yes')
+
+# Routes the checks apply to; catalog reads, /health and /metrics are never shed
+ADMISSION_ROUTES = ('/get-price', '/get-prices')
+SHED_REASONS = ('queue_time', 'concurrency', 'client_rate')
+
+WORKER_FIELDS = ('pid', 'in_flight', 'admitted') + SHED_REASONS + ('queue_wait_seconds', 'queue_waits')
+FIELD = {name: i for i, name in enumerate(WORKER_FIELDS)}
+MAX_WORKERS = 256
+CLIENT_BUCKETS = 8192
+
+DOUBLE = array('d').itemsize
+BUCKETS_OFFSET = MAX_WORKERS * len(WORKER_FIELDS)    # in doubles
+FILE_SIZE = (BUCKETS_OFFSET + CLIENT_BUCKETS * 2) * DOUBLE
+
+def parse_request_start(value):
+    """Unix seconds from an X-Request-Start header ('t=<ms>', '<ms>', '<us>' or '<s>.<fraction>')"""
+    if not value:
+        return None
+    try:
+        stamp = float(value.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    if stamp > 1e14:
+        return stamp / 1e6
+    if stamp > 1e11:
+        return stamp / 1e3
+    return stamp
+
+def client_key(sender, forwarded_for=None, remote_addr=None, key_by_ip=ADMISSION_KEY_BY_IP):
+    """Bucket key for a request: its sender, else (if enabled) its IP, else None (no rate limit)"""
+    sender = str(sender).strip() if sender is not None else ''
+    if sender:
+        return 'sender:' + sender
+    if not key_by_ip:
+        return None
+    # The proxy appends the address it saw; earlier entries are whatever the client sent
+    address = forwarded_for.split(',')[-1].strip() if forwarded_for else remote_addr
+    return 'ip:' + address if address else None
+
+def rejection_body(status, retry_after):
+    if status == 429:
+        return {
+            "error": "Too many requests",
+            "message": f"Rate limit exceeded, retry in {retry_after}s",
+            "retry_after": retry_after
+        }
+    return {
+        "error": "Server busy",
+        "message": f"Too many requests in progress, retry in {retry_after}s",
+        "retry_after": retry_after
+    }
+
+class Admission(ProcessFile):
+    """Queue-time, concurrency and per-client rate checks over a file shared by all workers"""
+
+    def __init__(self, directory=METRICS_DIR, max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+                 max_queue_ms=ADMISSION_MAX_QUEUE_MS, client_rate=ADMISSION_CLIENT_RATE,
+                 client_burst=ADMISSION_CLIENT_BURST):
+        self.max_in_flight = max_in_flight
+        self.max_queue_seconds = max_queue_ms / 1000
+        self.client_rate = client_rate
+        self.client_burst = max(client_burst, 1)
+        super().__init__(directory, 'admission', FILE_SIZE)
+
+    def forget_file(self):
+        super().forget_file()
+        self.fd = None
+        self.values = None
+        self.slot = None
+
+    def open_file(self):
+        """Map the shared file and claim this process's worker slot (the gunicorn master never does)"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{self.name}.metrics')
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        # Whole-file lock: sizing the file and claiming slots must not race another worker
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size != FILE_SIZE:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, FILE_SIZE)
+            buffer = mmap(fd, FILE_SIZE)
+            values = memoryview(buffer).cast('d')
+            width = len(WORKER_FIELDS)
+            pid = os.getpid()
+            slot = None
+            for base in range(0, BUCKETS_OFFSET, width):
+                owner = int(values[base])
+                if owner == pid and path in MAPPED_PATHS:
+                    # Another instance in this process already counts here
+                    slot = base
+                    break
+                # A slot under our pid was left by an exited process that had it; a worker killed
+                # mid-request leaves its in-flight count behind. Either way it starts from zeros.
+                if owner and (owner == pid or not process_alive(owner)):
+                    values[base:base + width] = array('d', bytes(width * DOUBLE))
+                    owner = 0
+                if not owner and slot is None:
+                    slot = base
+            if slot is None:
+                raise RuntimeError(f"All {MAX_WORKERS} admission slots are held by live processes")
+            values[slot] = pid
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+        MAPPED_PATHS.add(path)
+        self.fd, self.buffer, self.values, self.slot, self.path = fd, buffer, values, slot, path
+        return values
+
+    def close_file(self):
+        """Give this process's slot back at exit"""
+        width = len(WORKER_FIELDS)
+        self.values[self.slot:self.slot + width] = array('d', bytes(width * DOUBLE))
+
+    def in_flight(self):
+        values = self.values or self.open_file()
+        return int(sum(values[FIELD['in_flight']:BUCKETS_OFFSET:len(WORKER_FIELDS)]))
+
+    def lock_slots(self, operation):
+        fcntl.lockf(self.fd, operation, BUCKETS_OFFSET * DOUBLE, 0)
+
+    def admit(self, client=None, request_start=None, now=None):
+        """None when the request may proceed (call release() after it), else (status, retry_after, reason)"""
+        now = time.time() if now is None else now
+        with self.lock:
+            values = self.values or self.open_file()
+            slot = self.slot
+            if request_start is not None:
+                waited = max(now - request_start, 0.0)
+                values[slot + FIELD['queue_wait_seconds']] += waited
+                values[slot + FIELD['queue_waits']] += 1
+                if self.max_queue_seconds and waited > self.max_queue_seconds:
+                    return self.shed('queue_time', 503, 1)
+            # Other workers check and count under the same lock, so the limit can't be overshot
+            self.lock_slots(fcntl.LOCK_EX)
+            try:
+                # Checked before the bucket so a request turned away here costs the client no token
+                if self.max_in_flight and self.in_flight() >= self.max_in_flight:
+                    return self.shed('concurrency', 503, 1)
+                if client is not None and self.client_rate > 0:
+                    retry_after = self.take_token(client, now)
+                    if retry_after:
+                        return self.shed('client_rate', 429, retry_after)
+                values[slot + FIELD['in_flight']] += 1
+                values[slot + FIELD['admitted']] += 1
+            finally:
+                self.lock_slots(fcntl.LOCK_UN)
+        return None
+
+    def release(self):
+        with self.lock:
+            self.values[self.slot + FIELD['in_flight']] -= 1
+
+    def shed(self, reason, status, retry_after):
+        self.values[self.slot + FIELD[reason]] += 1
+        return status, retry_after, reason
+
+    def take_token(self, client, now):
+        """0 if the client's bucket had a token, else whole seconds until it will"""
+        cell = BUCKETS_OFFSET + zlib.crc32(client.encode('utf-8')) % CLIENT_BUCKETS * 2
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, 2 * DOUBLE, cell * DOUBLE)
+        try:
+            values = self.values
+            # A bucket never used (updated == 0) refills straight to the burst size
+            tokens = min(self.client_burst, values[cell] + max(now - values[cell + 1], 0.0) * self.client_rate)
+            values[cell + 1] = now
+            if tokens >= 1:
+                values[cell] = tokens - 1
+                return 0
+            values[cell] = tokens
+            return max(math.ceil((1 - tokens) / self.client_rate), 1)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 2 * DOUBLE, cell * DOUBLE)
+
+    def workers(self):
+        """(pid, slot values) for every live process that has claimed a slot"""
+        values = self.values or self.open_file()
+        width = len(WORKER_FIELDS)
+        for base in range(0, BUCKETS_OFFSET, width):
+            pid = int(values[base])
+            if pid and process_alive(pid):
+                yield pid, values[base:base + width]
+
+    def totals(self):
+        """Counters summed over the live workers' slots"""
+        workers = [values for _, values in self.workers()]
+        return {name: sum(values[FIELD[name]] for values in workers) for name in WORKER_FIELDS[2:]}
+
+    def stats(self):
+        totals = self.totals()
+        waits = totals['queue_waits']
+        return {
+            'in_flight': self.in_flight(),
+            'max_in_flight': self.max_in_flight,
+            'admitted': int(totals['admitted']),
+            'shed': {reason: int(totals[reason]) for reason in SHED_REASONS},
+            'avg_queue_wait_ms': round(totals['queue_wait_seconds'] / waits * 1000, 3) if waits else None
+        }
+
+    def render(self):
+        """Admission metrics in the Prometheus text exposition format"""
+        totals = self.totals()
+        lines = [
+            '# HELP pricing_admission_requests_total Webhook requests admitted, or shed by reason (queue_time, concurrency: 503; client_rate: 429).',
+            '# TYPE pricing_admission_requests_total counter',
+            f'pricing_admission_requests_total{{result="admitted"}} {format_value(totals["admitted"])}'
+        ]
+        lines += [
+            f'pricing_admission_requests_total{{result="{escape(reason)}"}} {format_value(totals[reason])}'
+            for reason in SHED_REASONS
+        ]
+        lines += [
+            '# HELP pricing_admission_queue_wait_seconds Time between the router (X-Request-Start) and a worker picking the request up.',
+            '# TYPE pricing_admission_queue_wait_seconds summary',
+            f'pricing_admission_queue_wait_seconds_sum {totals["queue_wait_seconds"]!r}',
+            f'pricing_admission_queue_wait_seconds_count {format_value(totals["queue_waits"])}',
+            '# HELP pricing_admission_in_flight Webhook requests in progress, per worker.',
+            '# TYPE pricing_admission_in_flight gauge'
+        ]
+        lines += [
+            f'pricing_admission_in_flight{{pid="{pid}"}} {format_value(values[FIELD["in_flight"]])}'
+            for pid, values in self.workers()
+        ]
+        return ('\n'.join(lines) + '\n').encode('utf-8')
@@ -0,0 +1,308 @@
+"""
+GaadiMech Pricing Webhook API - asyncio/ASGI variant.
+
+Serves the same routes and response bodies as app_optimized.py from the same
+lookup core (pricing_store.py), without a framework: every lookup is a few
+microseconds of CPU, so handlers run inline on the event loop and a single
+process can hold thousands of idle keep-alive connections during a Wati burst.
+
+Run with any ASGI server, e.g.: uvicorn app_asgi:app --host 0.0.0.0 --port 5000
+"""
+
+import time
+STARTED = time.perf_counter()    # before any other import, for the startup report
+
+import json
+import os
+from urllib.parse import parse_qs
+
+from admission import ADMISSION_CLIENT_FIELD, ADMISSION_ROUTES, Admission, client_key, parse_request_start, rejection_body
+from app_common import admin_authorized
+from pricing_index import dump_json, etag_matches, negotiate_encoding
+from pricing_store import (
+    PricingStore, price_key, render_fuel_brands_body, render_fuel_types_body, render_models_body, resolve_price
+)
+from metrics import Metrics
+from miss_tracker import MissTracker
+from request_log import RequestLog
+from startup import StartupReport
+
+startup = StartupReport(STARTED)
+startup.mark('imports')
+
+MAX_BODY_SIZE = 1024 * 1024
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', 60))
+
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+# Pricing snapshot, rebuilt in the background whenever pricing_data.json changes
+store = PricingStore()
+startup.mark_store(store)
+
+# JSONL audit trail of /get-price calls, written by a background thread
+request_log = RequestLog()
+
+# Sheds webhook bursts with 429/503 + Retry-After instead of letting them queue
+admission = Admission()
+
+# Most-requested cars that aren't in the sheet, shared with the Flask workers' counts
+misses = MissTracker()
+
+def parse_json(body):
+    """Request JSON, or None when absent/invalid (what Flask's get_json() leaves us to handle)"""
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+def header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+def admit(scope, body):
+    """None if the request may run, else the 429/503 reply"""
+    sender = header(scope, b'x-client-id')
+    if not sender:
+        data = parse_json(body)
+        sender = data.get(ADMISSION_CLIENT_FIELD) if isinstance(data, dict) else None
+    remote = scope.get('client')
+    client = client_key(sender, header(scope, b'x-forwarded-for'), remote[0] if remote else None)
+    rejected = admission.admit(client, parse_request_start(header(scope, b'x-request-start')))
+    if rejected:
+        status, retry_after, _ = rejected
+        return status, rejection_body(status, retry_after), [(b'retry-after', str(retry_after).encode('ascii'))]
+    scope['admitted'] = True
+    return None
+
+def catalog_reply(scope, variants):
+    """Catalog body in the best accepted encoding with validators, or a bodyless 304"""
+    coding, (body, content_length, etag) = negotiate_encoding(header(scope, b'accept-encoding'), variants)
+    headers = [
+        (b'etag', etag.encode('ascii')),
+        (b'cache-control', f'public, max-age={CATALOG_MAX_AGE}'.encode('ascii')),
+        (b'vary', b'Accept-Encoding')
+    ]
+    if coding != 'identity':
+        headers.append((b'content-encoding', coding.encode('ascii')))
+    if scope['method'] == 'GET' and etag_matches(header(scope, b'if-none-match'), etag):
+        return 304, b'', headers
+    return 200, body, headers
+
+def health_check(scope, body):
+    snapshot = store.data
+    return 200, {
+        "status": "healthy",
+        "data_loaded": snapshot is not None,
+        "data_version": snapshot['version'] if snapshot else None,
+        "total_records": snapshot['total_records'] if snapshot else 0,
+        "startup": startup.as_dict(),
+        "request_log": request_log.stats(),
+        "admission": admission.stats()
+    }
+
+def get_price(scope, body):
+    try:
+        data = parse_json(body)
+        scope['price_item'] = data
+
+        if not data or not isinstance(data, dict):
+            return 400, {
+                "error": "No data provided",
+                "message": "Please provide JSON data with CarManufacturer, CarModel, and FuelType"
+            }
+
+        # The snapshot is pinned so the log records the version this price came from
+        scope['price_snapshot'] = snapshot = store.data
+        status, result = resolve_price(snapshot, data)
+
+        if status == 200:
+            return 200, result[0]
+
+        if status == 404:
+            misses.observe(price_key(snapshot, data))
+        return status, result
+
+    except Exception as e:
+        return 500, {
+            "error": "Internal server error",
+            "message": str(e)
+        }
+
+def get_brands(scope, body):
+    snapshot = store.data
+    if not snapshot:
+        return 500, {"error": "Data not available"}
+
+    return catalog_reply(scope, snapshot['catalog']['brands'])
+
+def request_fields(scope, body):
+    """Query parameters of a GET, or the JSON body of a POST ({} when it isn't a JSON object)"""
+    if scope['method'] == 'GET':
+        query = parse_qs(scope['query_string'].decode('latin-1'))
+        return {name: values[0] for name, values in query.items()}
+    data = parse_json(body)
+    return data if isinstance(data, dict) else {}
+
+def get_models(scope, body):
+    try:
+        data = request_fields(scope, body)
+        brand = data.get('CarManufacturer', '').strip()
+
+        if not brand:
+            return 400, {"error": "CarManufacturer is required"}
+
+        snapshot = store.data
+        if not snapshot:
+            return 500, {"error": "Data not available"}
+
+        return catalog_reply(scope, render_models_body(snapshot, brand, data.get('FuelType', '').strip()))
+    except Exception as e:
+        return 500, {"error": str(e)}
+
+def get_fuel_types(scope, body):
+    try:
+        snapshot = store.data
+        if not snapshot:
+            return 500, {"error": "Data not available"}
+
+        data = request_fields(scope, body)
+        brand = data.get('CarManufacturer', '').strip()
+        model = data.get('CarModel', '').strip()
+        return catalog_reply(scope, render_fuel_types_body(snapshot, brand, model))
+    except Exception as e:
+        return 500, {"error": str(e)}
+
+def get_brands_for_fuel(scope, body):
+    try:
+        data = request_fields(scope, body)
+        fuel_type = data.get('FuelType', '').strip()
+
+        if not fuel_type:
+            return 400, {"error": "FuelType is required"}
+
+        snapshot = store.data
+        if not snapshot:
+            return 500, {"error": "Data not available"}
+
+        return catalog_reply(scope, render_fuel_brands_body(snapshot, fuel_type))
+    except Exception as e:
+        return 500, {"error": str(e)}
+
+def prometheus_metrics(scope, body):
+    return 200, metrics.render() + admission.render(), [(b'content-type', b'text/plain; version=0.0.4')]
+
+def admin_misses(scope, body):
+    """The most-requested cars that got a 404, summed over every worker"""
+    if not admin_authorized(header(scope, b'x-admin-token')):
+        return 403, {"error": "Forbidden"}
+
+    try:
+        limit = min(max(int(request_fields(scope, body).get('limit', 50)), 1), 500)
+    except ValueError:
+        return 400, {"error": "limit must be an integer"}
+
+    return 200, {"success": True, **misses.top(limit)}
+
+ROUTES = {
+    '/health': {'GET': health_check},
+    '/get-price': {'POST': get_price},
+    '/get-brands': {'GET': get_brands},
+    '/get-models': {'GET': get_models, 'POST': get_models},
+    '/get-fuel-types': {'GET': get_fuel_types},
+    '/get-brands-for-fuel': {'GET': get_brands_for_fuel, 'POST': get_brands_for_fuel},
+    '/metrics': {'GET': prometheus_metrics},
+    '/admin/misses': {'GET': admin_misses},
+}
+
+metrics = Metrics(ROUTES)
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_SIZE:
+            raise ValueError("Request body too large")
+        if not message.get('more_body'):
+            return body
+
+async def send_response(send, status, payload, extra_headers=()):
+    body = payload if isinstance(payload, bytes) else dump_json(payload)
+    headers = [*CORS_HEADERS, *extra_headers]
+    if status != 304:
+        headers.insert(0, (b'content-length', str(len(body)).encode('ascii')))
+        if not any(name == b'content-type' for name, _ in extra_headers):
+            headers.insert(0, (b'content-type', b'application/json'))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': headers
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def dispatch(scope, receive):
+    """(status, payload[, headers]) for one HTTP request"""
+    route = ROUTES.get(scope['path'])
+    if route is None:
+        return 404, {"error": "Not found"}
+
+    methods = ', '.join(route).encode('ascii')
+    if scope['method'] == 'OPTIONS':
+        # CORS preflight, as flask-cors answers it
+        requested = header(scope, b'access-control-request-headers') or 'content-type'
+        return 200, b'', [
+            (b'access-control-allow-methods', methods),
+            (b'access-control-allow-headers', requested.encode('latin-1'))
+        ]
+    handler = route.get(scope['method'])
+    if handler is None:
+        return 405, {"error": "Method not allowed"}, [(b'allow', methods)]
+
+    try:
+        body = await read_body(receive) if scope['method'] == 'POST' else b''
+    except ValueError as e:
+        return 413, {"error": str(e)}
+
+    if scope['method'] == 'POST' and scope['path'] in ADMISSION_ROUTES:
+        rejected = admit(scope, body)
+        if rejected:
+            return rejected
+
+    return handler(scope, body)
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    started = time.perf_counter()
+    store.maybe_reload()
+    metrics.observe_snapshot(store.data)
+    metrics.observe_request_log(request_log.written, request_log.dropped)
+
+    try:
+        reply = await dispatch(scope, receive)
+        elapsed = time.perf_counter() - started
+        metrics.observe_request(scope['path'], reply[0], elapsed)
+        if scope['path'] == '/get-price':
+            request_log.record(scope.get('price_item'), reply[0], scope.get('price_snapshot'), elapsed)
+        await send_response(send, *reply)
+    finally:
+        # Admitted requests count as in flight until the response is handed to the server
+        if scope.get('admitted'):
+            admission.release()
+
+startup.finish()
@@ -0,0 +1,23 @@
+"""
+Helpers shared by the entry points (app.py, app_simple.py, app_optimized.py, app_asgi.py).
+
+Nothing here imports a web framework, so the ASGI app can use it too.
+"""
+
+import hmac
+import os
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+def admin_authorized(token):
+    """Whether an X-Admin-Token value opens the /admin routes (never, when ADMIN_TOKEN is unset)"""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token or '', ADMIN_TOKEN)
+
+def json_bytes_response(response_class, body, content_length, status=200):
+    """Send ready-made JSON bytes without going through jsonify"""
+    return response_class(
+        [body],
+        status=status,
+        headers={'Content-Length': content_length},
+        mimetype='application/json'
+    )
@@ -1,245 +1,226 @@
-from flask import Flask, request, jsonify
-import json
+import time
+STARTED = time.perf_counter()    # before any other import, for the startup report
+
+from flask import Flask, request, jsonify, g
+import functools
 import os
 from flask_cors import CORS
+from app_common import admin_authorized, json_bytes_response
+from admission import ADMISSION_CLIENT_FIELD, ADMISSION_ROUTES, Admission, client_key, parse_request_start, rejection_body
+from pricing_index import dump_json, etag_matches, iter_catalog_lines, negotiate_encoding
+from pricing_store import (
+    PricingStore, catalog_scope, price_key, render_fuel_brands_body, render_fuel_types_body, render_models_body,
+    resolve_price
+)
+from metrics import Metrics
+from miss_tracker import MissTracker
+from request_log import RequestLog
+from startup import StartupReport
+
+startup = StartupReport(STARTED)
+startup.mark('imports')
 
 app = Flask(__name__)
 CORS(app)
 
-# Convert CSV to optimized JSON structure for faster lookups
-def create_optimized_data():
-    """Create an optimized data structure from CSV for faster lookups"""
-    import csv
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 1000))
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', 60))
+
+def admin_only(view):
+    """Answer 403 unless the request carries the ADMIN_TOKEN in X-Admin-Token"""
+    @functools.wraps(view)
+    def guarded(*args, **kwargs):
+        if not admin_authorized(request.headers.get('X-Admin-Token')):
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return guarded
+
+def catalog_response(variants):
+    """
+    Pre-rendered catalog body in the best encoding the client accepts, with
+    validators; a GET whose If-None-Match matches gets a bodyless 304.
+    """
+    coding, (body, content_length, etag) = negotiate_encoding(request.headers.get('Accept-Encoding'), variants)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={CATALOG_MAX_AGE}',
+        'Vary': 'Accept-Encoding'
+    }
+    if coding != 'identity':
+        headers['Content-Encoding'] = coding
+    if request.method in ('GET', 'HEAD') and etag_matches(request.headers.get('If-None-Match'), etag):
+        return app.response_class(status=304, headers=headers)
     
-    try:
-        with open('GM Pricing March Website Usage -Final.csv', 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            data = list(reader)
-        
-        # Create nested dictionary for O(1) lookups: fuel_type -> brand -> model -> prices
-        optimized = {}
-        brands = set()
-        fuel_types = set()
-        
-        for record in data:
-            fuel = record['FuelType'].lower()
-            brand = record['Car Brand'].lower()
-            model = record['Car Model'].lower()
-            
-            fuel_types.add(record['FuelType'])
-            brands.add(record['Car Brand'])
-            
-            if fuel not in optimized:
-                optimized[fuel] = {}
-            if brand not in optimized[fuel]:
-                optimized[fuel][brand] = {}
-            
-            # Clean and store prices
-            def clean_price(price_str):
-                if not price_str or price_str.strip() == '' or price_str == '#N/A':
-                    return None
-                try:
-                    cleaned = ''.join(c for c in str(price_str) if c.isdigit() or c == '.')
-                    return int(float(cleaned)) if cleaned else None
-                except:
-                    return None
-            
-            optimized[fuel][brand][model] = {
-                'original_fuel': record['FuelType'],
-                'original_brand': record['Car Brand'],
-                'original_model': record['Car Model'],
-                'periodic_service': clean_price(record['Periodic Service Price GaadiMech']),
-                'express_service': clean_price(record['Express Service Price GaadiMech']),
-                'discounted_price': clean_price(record['Discounted Price']),
-                'comprehensive_service': clean_price(record['Comprehensive Service Price GaadiMech']),
-                'dent_paint': clean_price(record['Dent & Paint Price GaadiMech']),
-                'full_body_paint': clean_price(record['Dent and Paint Full Body'])
-            }
-        
-        # Save optimized data to JSON file
-        result = {
-            'data': optimized,
-            'brands': sorted(list(brands)),
-            'fuel_types': sorted(list(fuel_types)),
-            'total_records': len(data)
-        }
-        
-        with open('pricing_data.json', 'w') as f:
-            json.dump(result, f, separators=(',', ':'))  # Compact JSON
-        
-        print(f"✅ Optimized data created: {len(data)} records")
-        return result
-        
-    except Exception as e:
-        print(f"❌ Error creating optimized data: {e}")
+    headers['Content-Length'] = content_length
+    return app.response_class([body], headers=headers, mimetype='application/json')
+
+# Pricing snapshot, rebuilt in the background whenever pricing_data.json changes
+store = PricingStore()
+startup.mark_store(store)
+
+# JSONL audit trail of /get-price calls, written by a background thread
+request_log = RequestLog()
+
+# Which cars customers ask for that the sheet doesn't have, in fixed memory
+misses = MissTracker()
+
+# Sheds webhook bursts with 429/503 + Retry-After instead of letting them queue
+admission = Admission()
+
+@app.before_request
+def check_for_new_data():
+    g.started = time.perf_counter()
+    store.maybe_reload()
+    metrics.observe_snapshot(store.data)
+    metrics.observe_request_log(request_log.written, request_log.dropped)
+
+@app.before_request
+def admit_request():
+    if request.method != 'POST' or not request.url_rule or request.url_rule.rule not in ADMISSION_ROUTES:
         return None
+    sender = request.headers.get('X-Client-Id')
+    if not sender:
+        # Parsed once; the view's get_json() reuses it
+        body = request.get_json(silent=True)
+        sender = body.get(ADMISSION_CLIENT_FIELD) if isinstance(body, dict) else None
+    client = client_key(sender, request.headers.get('X-Forwarded-For'), request.remote_addr)
+    rejected = admission.admit(client, parse_request_start(request.headers.get('X-Request-Start')))
+    if rejected:
+        status, retry_after, _ = rejected
+        response = jsonify(rejection_body(status, retry_after))
+        response.status_code = status
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    g.admitted = True
+    return None
 
-# Try to load existing optimized data, create if doesn't exist
-try:
-    with open('pricing_data.json', 'r') as f:
-        pricing_data = json.load(f)
-    
-    # Calculate stats from the new structure
-    total_records = sum(
-        sum(len(models) for models in brands.values()) 
-        for brands in pricing_data['data'].values()
-    )
-    
-    # Extract unique brands and fuel types
-    brands = set()
-    fuel_types = list(pricing_data['data'].keys())
-    
-    for fuel_data in pricing_data['data'].values():
-        for brand_data in fuel_data.values():
-            for model_data in brand_data.values():
-                brands.add(model_data['original_brand'])
-    
-    # Add metadata to pricing_data for compatibility
-    pricing_data['total_records'] = total_records
-    pricing_data['brands'] = sorted(list(brands))
-    pricing_data['fuel_types'] = fuel_types
-    
-    print(f"✅ Loaded optimized data: {total_records} records, {len(brands)} brands, {len(fuel_types)} fuel types")
-    
-except FileNotFoundError:
-    print("📦 Creating optimized data structure...")
-    pricing_data = create_optimized_data()
+@app.teardown_request
+def release_request(exception):
+    if g.pop('admitted', False):
+        admission.release()
+
+@app.after_request
+def record_metrics(response):
+    route = request.url_rule.rule if request.url_rule else None
+    elapsed = time.perf_counter() - g.started
+    metrics.observe_request(route, response.status_code, elapsed)
+    if route == '/get-price':
+        request_log.record(g.get('price_item'), response.status_code, g.get('price_snapshot'), elapsed)
+    return response
 
 @app.route('/', methods=['GET'])
 def home():
+    snapshot = store.data
     return jsonify({
         "message": "GaadiMech Pricing Webhook API - Optimized",
         "status": "active",
-        "data_loaded": pricing_data is not None,
-        "total_records": pricing_data['total_records'] if pricing_data else 0,
-        "total_brands": len(pricing_data['brands']) if pricing_data else 0,
+        "data_loaded": snapshot is not None,
+        "total_records": snapshot['total_records'] if snapshot else 0,
+        "total_brands": len(snapshot['brands']) if snapshot else 0,
         "endpoints": {
             "/get-price": "POST - Get pricing information",
+            "/get-prices": "POST - Get pricing for a batch of cars",
             "/get-brands": "GET - Get available car brands", 
-            "/get-models": "POST - Get models for a brand",
-            "/get-fuel-types": "GET - Get available fuel types",
+            "/get-models": "GET/POST - Get models for a brand, optionally for one fuel type",
+            "/get-fuel-types": "GET - Get available fuel types, optionally for a brand or model",
+            "/get-brands-for-fuel": "GET/POST - Get brands available for a fuel type",
+            "/autocomplete": "GET - Brand/model completions for a prefix",
+            "/export": "GET - Stream the full price catalog as NDJSON",
+            "/metrics": "GET - Prometheus metrics for all workers",
             "/health": "GET - Health check"
         }
     })
 
 @app.route('/health', methods=['GET'])
 def health_check():
+    snapshot = store.data
     return jsonify({
         "status": "healthy",
-        "data_loaded": pricing_data is not None,
-        "total_records": pricing_data['total_records'] if pricing_data else 0
+        "data_loaded": snapshot is not None,
+        "data_version": snapshot['version'] if snapshot else None,
+        "total_records": snapshot['total_records'] if snapshot else 0,
+        "startup": startup.as_dict(),
+        "request_log": request_log.stats(),
+        "admission": admission.stats()
     })
 
 @app.route('/get-price', methods=['POST'])
 def get_price():
     try:
-        data = request.get_json()
+        # silent: a non-JSON body is a 400 below, not Flask's 415 turned into a 500
+        data = request.get_json(silent=True)
+        g.price_item = data
         
-        if not data:
+        if not data or not isinstance(data, dict):
             return jsonify({
                 "error": "No data provided",
                 "message": "Please provide JSON data with CarManufacturer, CarModel, and FuelType"
             }), 400
         
-        car_manufacturer = data.get('CarManufacturer', '').strip()
-        car_model = data.get('CarModel', '').strip() 
-        fuel_type = data.get('FuelType', '').strip()
+        # The snapshot is pinned so the log records the version this price came from
+        g.price_snapshot = snapshot = store.data
+        status, result = resolve_price(snapshot, data)
+        
+        if status == 200:
+            # Hot path: ready-made bytes, no dict building or JSON encoding per request
+            return json_bytes_response(app.response_class, *result)
+        
+        if status == 404:
+            misses.observe(price_key(snapshot, data))
+        return jsonify(result), status
+            
+    except Exception as e:
+        return jsonify({
+            "error": "Internal server error",
+            "message": str(e)
+        }), 500
+
+@app.route('/get-prices', methods=['POST'])
+def get_prices():
+    try:
+        items = request.get_json()
+        if isinstance(items, dict):
+            items = items.get('items')
         
-        if not all([car_manufacturer, car_model, fuel_type]):
+        if not items or not isinstance(items, list):
             return jsonify({
-                "error": "Missing required parameters",
-                "message": "Please provide CarManufacturer, CarModel, and FuelType",
-                "received": {
-                    "CarManufacturer": car_manufacturer,
-                    "CarModel": car_model,
-                    "FuelType": fuel_type
-                }
+                "error": "No data provided",
+                "message": "Please provide a JSON array of {CarManufacturer, CarModel, FuelType} objects"
             }), 400
         
-        if not pricing_data:
+        if len(items) > MAX_BATCH_SIZE:
             return jsonify({
-                "error": "Data not available",
-                "message": "Pricing data could not be loaded"
-            }), 500
-        
-        # Fast O(1) lookup - find exact fuel type match (case-insensitive)
-        fuel_key = None
-        for available_fuel in pricing_data['data'].keys():
-            if fuel_type.lower() == available_fuel.lower():
-                fuel_key = available_fuel
-                break
+                "error": "Too many items",
+                "message": f"A batch may contain at most {MAX_BATCH_SIZE} items, got {len(items)}"
+            }), 413
         
-        brand_key = car_manufacturer.lower()
-        model_key = car_model.lower()
-        
-        if (fuel_key and fuel_key in pricing_data['data'] and 
-            brand_key in pricing_data['data'][fuel_key] and
-            model_key in pricing_data['data'][fuel_key][brand_key]):
-            
-            record = pricing_data['data'][fuel_key][brand_key][model_key]
-            
-            def format_price(price):
-                return str(price) if price is not None else "Not Available"
-            
-            response = {
-                "success": True,
-                "data": {
-                    "car_details": {
-                        "fuel_type": record['original_fuel'],
-                        "brand": record['original_brand'],
-                        "model": record['original_model']
-                    },
-                    "service_prices": {
-                        "periodic_service": {
-                            "price": format_price(record['periodic_service']),
-                            "description": "Regular maintenance service"
-                        },
-                        "express_service": {
-                            "price": format_price(record['express_service']),
-                            "description": "Quick service option"
-                        },
-                        "discounted_price": {
-                            "price": format_price(record['discounted_price']),
-                            "description": "Special discounted rate"
-                        },
-                        "comprehensive_service": {
-                            "price": format_price(record['comprehensive_service']),
-                            "description": "Complete service package"
-                        }
-                    },
-                    "paint_services": {
-                        "dent_and_paint": {
-                            "price": format_price(record['dent_paint']),
-                            "description": "Dent repair and painting"
-                        },
-                        "full_body_paint": {
-                            "price": format_price(record['full_body_paint']),
-                            "description": "Complete body painting"
-                        }
+        # Successful items are spliced in as their pre-rendered /get-price bytes;
+        # only errors get encoded here, tagged with the status /get-price would return
+        data = store.data
+        results = []
+        for item in items:
+            try:
+                if not isinstance(item, dict):
+                    status, result = 400, {
+                        "error": "No data provided",
+                        "message": "Please provide JSON data with CarManufacturer, CarModel, and FuelType"
                     }
-                }
-            }
+                else:
+                    status, result = resolve_price(data, item)
+                    if status == 404:
+                        misses.observe(price_key(data, item))
+            except Exception as e:
+                status, result = 500, {"error": "Internal server error", "message": str(e)}
             
-            return jsonify(response)
+            if status == 200:
+                results.append(result[0].rstrip(b"\n"))
+            else:
+                result["status"] = status
+                results.append(dump_json(result).rstrip(b"\n"))
+        
+        body = b'{"count":%d,"results":[%s],"success":true}\n' % (len(results), b','.join(results))
+        return json_bytes_response(app.response_class, body, str(len(body)))
         
-        else:
-            # Find suggestions
-            suggestions = {
-                "similar_brands": [],
-                "similar_models": []
-            }
-            
-            # Look for partial matches
-            for brand in pricing_data['brands']:
-                if car_manufacturer.lower() in brand.lower():
-                    suggestions["similar_brands"].append(brand)
-            
-            return jsonify({
-                "error": "No matching record found",
-                "message": f"No pricing data found for {fuel_type} {car_manufacturer} {car_model}",
-                "suggestions": suggestions
-            }), 404
-            
     except Exception as e:
         return jsonify({
             "error": "Internal server error",
@@ -249,58 +230,155 @@ def get_price():
 @app.route('/get-brands', methods=['GET'])
 def get_brands():
     try:
-        if not pricing_data:
+        snapshot = store.data
+        if not snapshot:
             return jsonify({"error": "Data not available"}), 500
         
-        return jsonify({
-            "success": True,
-            "brands": pricing_data['brands']
-        })
+        return catalog_response(snapshot['catalog']['brands'])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/get-models', methods=['POST'])
+def request_fields():
+    """Query parameters of a GET, or the JSON body of a POST ({} when it isn't a JSON object)"""
+    if request.method == 'GET':
+        return request.args
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else {}
+
+@app.route('/get-models', methods=['GET', 'POST'])
 def get_models():
     try:
-        data = request.get_json()
+        # GET (?CarManufacturer=) is what browsers and proxies can cache and revalidate
+        data = request_fields()
         brand = data.get('CarManufacturer', '').strip()
         
         if not brand:
             return jsonify({"error": "CarManufacturer is required"}), 400
         
-        if not pricing_data:
+        snapshot = store.data
+        if not snapshot:
             return jsonify({"error": "Data not available"}), 500
         
-        models = set()
-        brand_key = brand.lower()
-        
-        # Search across all fuel types for this brand
-        for fuel_data in pricing_data['data'].values():
-            if brand_key in fuel_data:
-                for model_key, model_data in fuel_data[brand_key].items():
-                    models.add(model_data['original_model'])
-        
-        return jsonify({
-            "success": True,
-            "brand": brand,
-            "models": sorted(list(models))
-        })
+        return catalog_response(render_models_body(snapshot, brand, data.get('FuelType', '').strip()))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/get-fuel-types', methods=['GET'])
 def get_fuel_types():
     try:
-        if not pricing_data:
+        snapshot = store.data
+        if not snapshot:
+            return jsonify({"error": "Data not available"}), 500
+        
+        brand = request.args.get('CarManufacturer', '').strip()
+        model = request.args.get('CarModel', '').strip()
+        return catalog_response(render_fuel_types_body(snapshot, brand, model))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/get-brands-for-fuel', methods=['GET', 'POST'])
+def get_brands_for_fuel():
+    try:
+        data = request_fields()
+        fuel_type = data.get('FuelType', '').strip()
+        
+        if not fuel_type:
+            return jsonify({"error": "FuelType is required"}), 400
+        
+        snapshot = store.data
+        if not snapshot:
+            return jsonify({"error": "Data not available"}), 500
+        
+        return catalog_response(render_fuel_brands_body(snapshot, fuel_type))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/autocomplete', methods=['GET'])
+def autocomplete():
+    try:
+        prefix = request.args.get('prefix', '').strip()
+        brand = request.args.get('CarManufacturer', '').strip()
+        fuel_type = request.args.get('FuelType', '').strip()
+        limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+        
+        if not prefix and not brand:
+            return jsonify({"error": "prefix or CarManufacturer is required"}), 400
+        
+        snapshot = store.data
+        if not snapshot:
             return jsonify({"error": "Data not available"}), 500
         
+        # Unknown fuel/brand scopes simply have no index and return no completions
+        fuel_key, brand_key = catalog_scope(snapshot, fuel_type, brand)
+        
+        brands, models = snapshot['autocomplete'].complete(prefix, fuel_key, brand_key, limit)
+        
         return jsonify({
             "success": True,
-            "fuel_types": pricing_data['fuel_types']
+            "prefix": prefix,
+            "brands": brands,
+            "models": [{"brand": b, "model": m} for b, m in models]
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/export', methods=['GET'])
+def export_catalog():
+    try:
+        snapshot = store.data
+        if not snapshot:
+            return jsonify({"error": "Data not available"}), 500
+        
+        brand = request.args.get('CarManufacturer', '').strip()
+        fuel_type = request.args.get('FuelType', '').strip()
+        
+        fuel_key, brand_key = catalog_scope(snapshot, fuel_type, brand)
+        
+        # The full catalog goes out pre-compressed when the client accepts it
+        if fuel_key is None and brand_key is None:
+            coding, compressed = negotiate_encoding(request.headers.get('Accept-Encoding'), snapshot['export'])
+            if compressed:
+                return app.response_class([compressed[0]], headers={
+                    'Content-Length': compressed[1],
+                    'Content-Encoding': coding,
+                    'Vary': 'Accept-Encoding'
+                }, mimetype='application/x-ndjson')
+        
+        # Streamed one brand at a time straight from the in-memory tree
+        lines = iter_catalog_lines(snapshot['data'], fuel_key, brand_key)
+        return app.response_class(lines, mimetype='application/x-ndjson')
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return app.response_class(metrics.render() + admission.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/reload', methods=['POST'])
+@admin_only
+def admin_reload():
+    """Force this worker to rebuild its snapshot (other workers follow the file's mtime)"""
+    return jsonify({
+        "success": True,
+        "reload_started": store.start_reload()
+    }), 202
+
+@app.route('/admin/misses', methods=['GET'])
+@admin_only
+def admin_misses():
+    """The most-requested cars that got a 404, summed over every worker"""
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    
+    return jsonify({"success": True, **misses.top(limit)})
+
+# Slot layout follows the route table, so this comes after every route is registered
+metrics = Metrics(rule.rule for rule in app.url_map.iter_rules() if rule.endpoint != 'static')
+
+startup.finish()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True) 
\ No newline at end of file
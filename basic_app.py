@@ -0,0 +1,131 @@
+"""
+The original webhook routes, served by app.py and app_simple.py.
+
+Both entry points build the same Flask app here; they differ only in the
+lookup backend they default to (see pricing_backends.py).
+"""
+
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+
+from app_common import json_bytes_response
+from pricing_store import PricingStore, render_models_body, resolve_price
+from startup import StartupReport
+
+def create_app(import_name, backend, started):
+    """(Flask app, PricingStore) on `backend`; `started` is the entry point's first perf_counter()"""
+    startup = StartupReport(started)
+    startup.mark('imports')
+
+    app = Flask(import_name)
+    CORS(app)  # Enable CORS for all routes
+
+    store = PricingStore(backend=backend)
+    startup.mark_store(store)
+
+    @app.before_request
+    def check_for_new_data():
+        store.maybe_reload()
+
+    @app.route('/', methods=['GET'])
+    def home():
+        snapshot = store.data
+        return jsonify({
+            "message": "GaadiMech Pricing Webhook API",
+            "status": "active",
+            "data_loaded": snapshot is not None,
+            "total_records": snapshot['total_records'] if snapshot else 0,
+            "endpoints": {
+                "/get-price": "POST - Get pricing information",
+                "/get-brands": "GET - Get available car brands",
+                "/get-models": "POST - Get models for a brand",
+                "/get-fuel-types": "GET - Get available fuel types",
+                "/health": "GET - Health check"
+            }
+        })
+
+    @app.route('/health', methods=['GET'])
+    def health_check():
+        snapshot = store.data
+        return jsonify({
+            "status": "healthy",
+            "data_loaded": snapshot is not None,
+            "total_records": snapshot['total_records'] if snapshot else 0,
+            "startup": startup.as_dict()
+        })
+
+    @app.route('/get-price', methods=['POST'])
+    def get_price():
+        try:
+            # Get JSON data from request; anything but a JSON object is a 400
+            data = request.get_json(silent=True)
+
+            if not data or not isinstance(data, dict):
+                return jsonify({
+                    "error": "No data provided",
+                    "message": "Please provide JSON data with CarManufacturer, CarModel, and FuelType"
+                }), 400
+
+            # Validation, lookup and suggestions are shared by every entry point
+            status, result = resolve_price(store.data, data)
+
+            if status == 200:
+                return json_bytes_response(app.response_class, *result)
+
+            return jsonify(result), status
+
+        except Exception as e:
+            return jsonify({
+                "error": "Internal server error",
+                "message": str(e)
+            }), 500
+
+    @app.route('/get-brands', methods=['GET'])
+    def get_brands():
+        """Get list of available car brands"""
+        try:
+            snapshot = store.data
+            if not snapshot:
+                return jsonify({"error": "Data not available"}), 500
+
+            body, content_length, _ = snapshot['catalog']['brands']['identity']
+            return json_bytes_response(app.response_class, body, content_length)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/get-models', methods=['POST'])
+    def get_models():
+        """Get list of available models for a specific brand"""
+        try:
+            data = request.get_json(silent=True)
+            data = data if isinstance(data, dict) else {}
+            brand = data.get('CarManufacturer', '').strip()
+
+            if not brand:
+                return jsonify({"error": "CarManufacturer is required"}), 400
+
+            snapshot = store.data
+            if not snapshot:
+                return jsonify({"error": "Data not available"}), 500
+
+            fuel_type = data.get('FuelType', '').strip()
+            body, content_length, _ = render_models_body(snapshot, brand, fuel_type)['identity']
+            return json_bytes_response(app.response_class, body, content_length)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/get-fuel-types', methods=['GET'])
+    def get_fuel_types():
+        """Get list of available fuel types"""
+        try:
+            snapshot = store.data
+            if not snapshot:
+                return jsonify({"error": "Data not available"}), 500
+
+            body, content_length, _ = snapshot['catalog']['fuel_types']['identity']
+            return json_bytes_response(app.response_class, body, content_length)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    startup.finish()
+    return app, store
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+In-process micro-benchmarks for the pricing lookup cores - no server needed.
+
+Each case is timed with timeit: the loop count is calibrated until one run
+takes at least --min-time, then the run is repeated --repeat times. The
+median per-call time is the headline number; min, mean, stdev and IQR are
+reported alongside so a noisy machine is visible. Results can be saved as
+JSON and compared against an earlier file, exiting non-zero on regressions.
+
+The pandas and list backends (the default engines of app.py and
+app_simple.py) are timed next to the index backend as baselines. Route cases call each app's Flask
+view function inside a request context built from a prepared WSGI environ,
+so all three apps pay the same per-request framework cost.
+
+Usage:
+  python benchmark.py                                   # everything, table output
+  python benchmark.py --filter lookup --repeat 15
+  python benchmark.py --json bench.json                 # save results
+  python benchmark.py --compare bench.json              # flag cases >10% slower
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timezone
+
+HIT = {"CarManufacturer": "Maruti", "CarModel": "Swift", "FuelType": "petrol"}
+TYPO = {"CarManufacturer": "Maruti", "CarModel": "Swfit", "FuelType": "petrol"}
+BRAND = {"CarManufacturer": "Hyundai"}
+
+def build_cases(work_dir):
+    """(group, name, callable) for every benchmark; imports happen here, outside the timings"""
+    import pandas as pd
+    import app as pandas_app
+    import app_simple
+    import app_optimized
+    from pricing_backends import BACKENDS, create_backend
+    from pricing_compiler import compile_pricing
+    from pricing_index import dump_json, make_key, render_price_body
+    from pricing_store import (
+        CSV_FILE, create_optimized_data, load_pricing_data, render_models_body, resolve_price
+    )
+
+    data_file = os.path.join(work_dir, 'pricing_data.json')
+    create_optimized_data(data_file)
+
+    snapshot = app_optimized.store.data
+    record = snapshot['index'][('petrol/cng', 'maruti', 'swift')]
+    price_dict = json.loads(render_price_body(record)[0])
+    hit_key = make_key(snapshot['fuel_aliases'], HIT['FuelType'], HIT['CarManufacturer'], HIT['CarModel'])
+    backends = {name: create_backend(name, snapshot) for name in BACKENDS}
+    # Every row of the sheet as a query, the way internal tools price a CSV in bulk
+    sheet_queries = pd.read_csv(CSV_FILE).rename(columns={'Car Brand': 'CarManufacturer', 'Car Model': 'CarModel'})
+
+    def read_csv_rows():
+        with open(CSV_FILE, 'r', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+
+    def route(module, view, payload):
+        # The WSGI environ is built once; each call only gets a fresh body stream
+        body = json.dumps(payload).encode('utf-8')
+        with module.app.test_request_context(method='POST', data=body, content_type='application/json') as context:
+            environ = context.request.environ
+        handler = module.app.view_functions[view]
+
+        def call():
+            with module.app.request_context({**environ, 'wsgi.input': io.BytesIO(body)}):
+                handler()
+        return call
+
+    return [
+        ('build', 'compile_pricing (full)', lambda: compile_pricing(CSV_FILE, data_file, force=True)),
+        ('build', 'compile_pricing (unchanged sheet)', lambda: compile_pricing(CSV_FILE, data_file)),
+        ('build', 'load_pricing_data', lambda: load_pricing_data(data_file)),
+        ('build', 'baseline: pandas read_csv', lambda: pd.read_csv(CSV_FILE)),
+        ('build', 'baseline: csv.DictReader', read_csv_rows),
+
+        ('lookup', 'resolve_price hit', lambda: resolve_price(snapshot, HIT)),
+        ('lookup', 'resolve_price typo (with suggestions)', lambda: resolve_price(snapshot, TYPO)),
+        ('lookup', 'suggester.suggest', lambda: snapshot['suggester'].suggest('Maruti', 'Swfit')),
+        ('lookup', 'render_models_body', lambda: render_models_body(snapshot, 'Hyundai')),
+        *[
+            ('lookup', f'backend {name}: response hit', lambda backend=backend: backend.response(hit_key))
+            for name, backend in backends.items()
+        ],
+        ('lookup', f'backend pandas: lookup_frame ({len(sheet_queries)} rows)', lambda: backends['pandas'].lookup_frame(sheet_queries)),
+
+        ('serialize', 'render_price_body', lambda: render_price_body(record)),
+        ('serialize', 'dump_json price dict', lambda: dump_json(price_dict)),
+        ('serialize', 'cached body (responses.get)', lambda: snapshot['responses'].get(('petrol/cng', 'maruti', 'swift'))),
+
+        ('route', 'get_price hit: app_optimized', route(app_optimized, 'get_price', HIT)),
+        ('route', 'get_price hit: app_simple (list scan)', route(app_simple, 'get_price', HIT)),
+        ('route', 'get_price hit: app (pandas)', route(pandas_app, 'get_price', HIT)),
+        ('route', 'get_price typo: app_optimized', route(app_optimized, 'get_price', TYPO)),
+        ('route', 'get_price typo: app_simple (list scan)', route(app_simple, 'get_price', TYPO)),
+        ('route', 'get_price typo: app (pandas)', route(pandas_app, 'get_price', TYPO)),
+        ('route', 'get_models: app_optimized', route(app_optimized, 'get_models', BRAND)),
+        ('route', 'get_models: app_simple (list scan)', route(app_simple, 'get_models', BRAND)),
+        ('route', 'get_models: app (pandas)', route(pandas_app, 'get_models', BRAND)),
+    ]
+
+def measure(func, repeat, min_time):
+    """Per-call statistics in microseconds over `repeat` calibrated runs"""
+    timer = timeit.Timer(func)
+    loops = 1
+    while timer.timeit(loops) < min_time:
+        loops *= 2
+    runs = [total / loops * 1e6 for total in timer.repeat(repeat, loops)]
+    quartiles = statistics.quantiles(runs, n=4) if len(runs) > 1 else [runs[0]] * 3
+    return {
+        "loops": loops,
+        "repeat": repeat,
+        "median_us": statistics.median(runs),
+        "min_us": min(runs),
+        "mean_us": statistics.mean(runs),
+        "stdev_us": statistics.stdev(runs) if len(runs) > 1 else 0.0,
+        "iqr_us": quartiles[2] - quartiles[0]
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def format_time(microseconds):
+    if microseconds >= 1000:
+        return f"{microseconds / 1000:.2f} ms"
+    return f"{microseconds:.2f} µs"
+
+def compare(results, baseline, threshold):
+    """Names of cases whose median got more than `threshold` slower than the baseline"""
+    regressions = []
+    print(f"\n📈 Against baseline ({baseline['meta'].get('commit')}, {baseline['meta'].get('timestamp')}):")
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if not before:
+            continue
+        ratio = result['median_us'] / before['median_us']
+        marker = "❌" if ratio > 1 + threshold else ("✅" if ratio < 1 - threshold else "  ")
+        print(f"{marker} {name:<42}{format_time(before['median_us']):>12} -> {format_time(result['median_us']):>12}  x{ratio:.2f}")
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark the pricing lookup cores")
+    parser.add_argument('--filter', default='', help="only cases whose group or name contains this")
+    parser.add_argument('--repeat', type=int, default=7, help="timed runs per case")
+    parser.add_argument('--min-time', type=float, default=0.1, help="minimum seconds per run")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--compare', help="earlier --json output to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='pricing-bench-')
+    try:
+        cases = [
+            case for case in build_cases(work_dir)
+            if args.filter.lower() in f"{case[0]} {case[1]}".lower()
+        ]
+        print(f"\n⏱️  {len(cases)} cases, {args.repeat} runs each\n")
+        print(f"{'group':<10}{'case':<42}{'median':>12}{'min':>12}{'stdev':>12}")
+
+        results = {}
+        for group, name, func in cases:
+            # Loaders print progress; keep that out of the table (and the timings)
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = measure(func, args.repeat, args.min_time)
+            result['group'] = group
+            results[name] = result
+            print(f"{group:<10}{name:<42}{format_time(result['median_us']):>12}"
+                  f"{format_time(result['min_us']):>12}{format_time(result['stdev_us']):>12}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "min_time": args.min_time
+        },
+        "results": results
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) over {args.threshold:.0%}")
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Gunicorn deployment profile for app_optimized.py.
+
+The master imports the app once (preload_app), so pricing data is parsed and
+indexed a single time and every forked worker starts with it already in
+memory. Copy-on-write keeps those pages shared only while nobody writes to
+them, and CPython's cyclic GC writes to every tracked object it scans, so GC
+is disabled while loading, the loaded objects are frozen out of its reach
+right before each fork, and collection is switched back on inside the worker.
+
+Run with: gunicorn -c gunicorn.conf.py app_optimized:app
+"""
+
+import gc
+import os
+
+# The master builds every deferrable cache before forking, so workers share one
+# copy instead of each building its own on first use (see pricing_store.py).
+# Set before pricing_store is imported, which reads it.
+os.environ.setdefault('PRICING_WARM', 'boot')
+
+from metrics import clear_metrics_directory
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Lookups are CPU-light; the cost under webhook bursts is waiting on slow
+# clients, so a few threads per worker keep the cores busy without a process
+# (and its private memory) per connection. WEB_CONCURRENCY is set by Heroku.
+workers = int(os.environ.get('WEB_CONCURRENCY', 2 * available_cores() + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+# Admission control's in-flight cap follows the server's size (see admission.py)
+os.environ.setdefault('ADMISSION_MAX_IN_FLIGHT', str(workers * threads))
+keepalive = 5
+preload_app = True
+
+# No collections while the master builds long-lived structures - freed
+# objects would leave holes in pages the workers are about to share
+gc.disable()
+
+def on_starting(server):
+    # Workers sum each other's metrics files; counts from a previous run must not leak in
+    clear_metrics_directory()
+
+def pre_fork(server, worker):
+    # The master itself stays GC-free; it allocates next to nothing after preload
+    gc.freeze()
+
+def post_fork(server, worker):
+    gc.enable()
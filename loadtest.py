@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Load test for the GaadiMech Pricing Webhook variants.
+
+Starts app.py, app_simple.py and app_optimized.py one after another under the
+same gunicorn settings on a free local port, sends each the same request
+list at a fixed concurrency over keep-alive connections, and reports
+throughput and p50/p95/p99 latency per endpoint and per app.
+
+Traffic is either a synthetic mix built from the price sheet (exact hits,
+misses, typos and catalog calls) or a replayed JSONL request log. A log line
+is either {"method": ..., "path": ..., "body": {...}} or a bare /get-price
+payload {"CarManufacturer": ..., "CarModel": ..., "FuelType": ...}.
+
+Usage:
+  python loadtest.py                                    # synthetic mix, all three apps
+  python loadtest.py --concurrency 32 --requests 5000 app_optimized.py
+  python loadtest.py --replay requests.log.jsonl app_simple.py app_optimized.py
+  python loadtest.py --url http://localhost:5000        # a server that is already running
+  python loadtest.py --json results.json                # machine-readable results too
+"""
+
+import argparse
+import csv
+import http.client
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+CSV_FILE = 'GM Pricing March Website Usage -Final.csv'
+APPS = ['app.py', 'app_simple.py', 'app_optimized.py']
+DEFAULT_MIX = 'hit=70,typo=15,miss=10,catalog=5'
+
+def load_catalog(csv_file=CSV_FILE):
+    """(fuel, brand, model) as the price sheet spells them - every app can answer these"""
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        return [(row['FuelType'], row['Car Brand'], row['Car Model']) for row in csv.DictReader(f)]
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - {'hit', 'typo', 'miss', 'catalog'}
+    if unknown:
+        raise ValueError(f"Unknown traffic kinds: {', '.join(sorted(unknown))}")
+    return mix
+
+def make_typo(text, rng):
+    """Swap, drop or double one letter - the mistakes chatbot users actually make"""
+    if len(text) < 3:
+        return text + text[-1]
+    i = rng.randrange(len(text) - 1)
+    kind = rng.choice(('swap', 'drop', 'double'))
+    if kind == 'swap':
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    if kind == 'drop':
+        return text[:i] + text[i + 1:]
+    return text[:i] + text[i] + text[i:]
+
+def price_request(fuel, brand, model):
+    return ('POST', '/get-price', {"CarManufacturer": brand, "CarModel": model, "FuelType": fuel})
+
+def synthetic_requests(catalog, count, mix, seed=0):
+    """A reproducible request list drawn from the catalog in the given proportions"""
+    rng = random.Random(seed)
+    brands = sorted({brand for _, brand, _ in catalog})
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+
+    requests_list = []
+    for kind in kinds:
+        fuel, brand, model = rng.choice(catalog)
+        if kind == 'hit':
+            requests_list.append(price_request(fuel, brand, model))
+        elif kind == 'typo':
+            requests_list.append(price_request(fuel, brand, make_typo(model, rng)))
+        elif kind == 'miss':
+            requests_list.append(price_request(fuel, brand, f"{model} Concept {rng.randrange(1000)}"))
+        else:
+            requests_list.append(rng.choice((
+                ('GET', '/get-brands', None),
+                ('GET', '/get-fuel-types', None),
+                ('POST', '/get-models', {"CarManufacturer": rng.choice(brands)})
+            )))
+    return requests_list
+
+def replay_requests(path):
+    """Requests from a JSONL log; lines that are neither format are skipped"""
+    requests_list = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(entry, dict):
+                continue
+            if 'path' in entry:
+                requests_list.append((entry.get('method', 'GET').upper(), entry['path'], entry.get('body')))
+            elif 'CarManufacturer' in entry:
+                requests_list.append(price_request(
+                    entry.get('FuelType', ''), entry['CarManufacturer'], entry.get('CarModel', '')
+                ))
+    return requests_list
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(app_file, port, workers, threads):
+    """Run an app under gunicorn with plain settings (the repo's gunicorn.conf.py is skipped on purpose)"""
+    config = tempfile.NamedTemporaryFile('w', suffix='.py', delete=False)
+    config.close()
+    module = os.path.splitext(os.path.basename(app_file))[0]
+    command = [
+        sys.executable, '-m', 'gunicorn', '-c', config.name,
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers),
+        '--worker-class', 'gthread', '--threads', str(threads),
+        f'{module}:app'
+    ]
+    server = subprocess.Popen(
+        command, cwd=os.path.dirname(os.path.abspath(app_file)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    server.config_file = config.name
+    return server
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+    os.remove(server.config_file)
+
+def wait_until_ready(host, port, server=None, timeout=60):
+    """Seconds until /health answers"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server on port {port} exited with status {server.returncode}")
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return time.perf_counter() - started
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not become healthy within {timeout}s")
+
+def endpoint_name(method, path):
+    return f"{method} {path.split('?')[0]}"
+
+def run_load(host, port, requests_list, concurrency):
+    """Send every request once from `concurrency` keep-alive clients: ([(endpoint, status, seconds)], wall seconds)"""
+    prepared = [
+        (endpoint_name(method, path), method, path,
+         json.dumps(body).encode('utf-8') if body is not None else None)
+        for method, path, body in requests_list
+    ]
+    positions = itertools.count()
+    results = []
+
+    def client():
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        measured = []
+        while True:
+            i = next(positions)
+            if i >= len(prepared):
+                break
+            endpoint, method, path, body = prepared[i]
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                # Connection dropped or timed out: count it as status 0 and reconnect
+                status = 0
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+            measured.append((endpoint, status, time.perf_counter() - started))
+        conn.close()
+        results.extend(measured)
+
+    started = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return results, time.perf_counter() - started
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(results, elapsed):
+    """Per endpoint (and 'ALL'): count, statuses, throughput and latency percentiles in ms"""
+    groups = defaultdict(list)
+    for endpoint, status, seconds in results:
+        groups[endpoint].append((status, seconds))
+        groups['ALL'].append((status, seconds))
+
+    summary = {}
+    for endpoint, samples in sorted(groups.items()):
+        latencies = sorted(seconds for _, seconds in samples)
+        statuses = defaultdict(int)
+        for status, _ in samples:
+            statuses[str(status)] += 1
+        summary[endpoint] = {
+            "requests": len(samples),
+            "statuses": dict(sorted(statuses.items())),
+            "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": latencies[-1] * 1000
+        }
+    return summary
+
+def print_report(name, summary, startup=None):
+    print(f"\n📊 {name}" + (f" (ready in {startup:.2f}s)" if startup is not None else ""))
+    print(f"{'endpoint':<22}{'requests':>9}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    for endpoint, row in summary.items():
+        statuses = ' '.join(f"{status}:{count}" for status, count in row['statuses'].items())
+        print(f"{endpoint:<22}{row['requests']:>9}{row['throughput_rps']:>10.0f}"
+              f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}  {statuses}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the pricing API variants")
+    parser.add_argument('apps', nargs='*', default=APPS, help="app files to start (default: all three)")
+    parser.add_argument('--url', help="test this running server instead of starting the apps")
+    parser.add_argument('--replay', help="JSONL request log to replay instead of synthetic traffic")
+    parser.add_argument('--requests', type=int, default=2000, help="synthetic requests per app")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"synthetic traffic weights (default {DEFAULT_MIX})")
+    parser.add_argument('--concurrency', type=int, default=16, help="simultaneous clients")
+    parser.add_argument('--warmup', type=int, default=100, help="unmeasured requests sent first")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers per app")
+    parser.add_argument('--threads', type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    if args.replay:
+        requests_list = replay_requests(args.replay)
+        print(f"📼 Replaying {len(requests_list)} requests from {args.replay}")
+    else:
+        requests_list = synthetic_requests(load_catalog(), args.requests, parse_mix(args.mix), args.seed)
+        print(f"🧪 {len(requests_list)} synthetic requests ({args.mix})")
+    if not requests_list:
+        print("❌ No requests to send")
+        return 1
+    warmup = requests_list[:args.warmup]
+
+    print(f"⚙️  concurrency {args.concurrency}, gunicorn {args.workers} workers x {args.threads} threads")
+
+    report = {"concurrency": args.concurrency, "requests": len(requests_list), "results": {}}
+    if args.url:
+        target = urlsplit(args.url)
+        run_load(target.hostname, target.port or 80, warmup, args.concurrency)
+        results, elapsed = run_load(target.hostname, target.port or 80, requests_list, args.concurrency)
+        summary = summarize(results, elapsed)
+        report["results"][args.url] = {"endpoints": summary}
+        print_report(args.url, summary)
+    else:
+        for app_file in args.apps:
+            port = free_port()
+            server = start_server(app_file, port, args.workers, args.threads)
+            try:
+                startup = wait_until_ready('127.0.0.1', port, server)
+                run_load('127.0.0.1', port, warmup, args.concurrency)
+                results, elapsed = run_load('127.0.0.1', port, requests_list, args.concurrency)
+            finally:
+                stop_server(server)
+            summary = summarize(results, elapsed)
+            report["results"][app_file] = {"startup_seconds": startup, "endpoints": summary}
+            print_report(app_file, summary, startup)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,296 @@
+"""
+Prometheus text-format metrics, aggregated across gunicorn workers.
+
+Every process counts into its own small mmap'd file, METRICS_DIR/<layout>-<pid>.metrics:
+a fixed array of doubles whose layout is decided by the route list, so an
+increment is a lock plus a memoryview store and never a syscall. /metrics,
+served by whichever worker gets the scrape, reads every live process's file
+and sums them. Files of exited processes are deleted (see ProcessFile), so
+their counts leave the totals, which Prometheus reads as a counter reset.
+The directory is also cleared when the gunicorn master starts (gunicorn.conf.py).
+"""
+
+import atexit
+import bisect
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+import weakref
+from array import array
+from mmap import mmap
+
+METRICS_DIR = os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'gaadimech-metrics')
+
+# Seconds; lookups are tens of microseconds, misses with suggestions a few hundred
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+UNMATCHED_ROUTE = 'unmatched'
+
+# /get-price status -> outcome
+PRICE_OUTCOMES = {200: 'hit', 404: 'miss', 400: 'invalid', 500: 'error'}
+SNAPSHOT_GAUGES = ('load_seconds', 'records', 'loaded_timestamp_seconds')
+REQUEST_LOG_RESULTS = ('written', 'dropped')
+
+VERSION_BYTES = 32
+DOUBLE = array('d').itemsize
+
+def clear_metrics_directory(directory=METRICS_DIR):
+    """Forget the previous server's counts - call once, before any worker starts"""
+    for path in glob.glob(os.path.join(directory, '*.metrics')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class ProcessFile:
+    """
+    State kept in an mmap'd file under METRICS_DIR, mapped on first use in each process.
+
+    Each process maps its own METRICS_DIR/<name>-<pid>.metrics. A file found there
+    under our pid was left by an exited process with the same pid, so it starts
+    from zeros. Files of exited processes are deleted whenever a process maps its
+    own or reads the others, and a process deletes its own when it exits. A forked
+    child drops its parent's mapping and maps its own file on first use.
+    """
+
+    def __init__(self, directory, name, file_size):
+        self.directory = directory
+        self.name = name
+        self.file_size = file_size
+        self.forget_file()
+        PROCESS_FILES.add(self)
+
+    def forget_file(self):
+        self.lock = threading.Lock()
+        self.path = None
+        self.buffer = None
+
+    def open_file(self):
+        """Map this process's file (the gunicorn master never gets one)"""
+        os.makedirs(self.directory, exist_ok=True)
+        for _ in self.process_paths():
+            pass
+        path = os.path.join(self.directory, f'{self.name}-{os.getpid()}.metrics')
+        # Another instance in this process may already count into it
+        with open(path, 'r+b' if path in MAPPED_PATHS else 'w+b') as f:
+            f.truncate(self.file_size)
+            self.buffer = mmap(f.fileno(), self.file_size)
+        MAPPED_PATHS.add(path)
+        self.path = path
+        return self.buffer
+
+    def close_file(self):
+        """Called at exit in a process that mapped a file"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def process_paths(self):
+        """(pid, path) of every live process's file; files of exited processes are deleted"""
+        prefix = os.path.join(self.directory, f'{self.name}-')
+        for path in glob.glob(prefix + '*.metrics'):
+            try:
+                pid = int(path[len(prefix):-len('.metrics')])
+            except ValueError:
+                continue
+            if process_alive(pid):
+                yield pid, path
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def read_files(self):
+        """(pid, contents) of every live process's file"""
+        for pid, path in self.process_paths():
+            try:
+                with open(path, 'rb') as f:
+                    contents = f.read()
+            except OSError:
+                continue
+            if len(contents) == self.file_size:
+                yield pid, contents
+
+# Fork and exit hooks are registered once for every instance, not once per instance
+PROCESS_FILES = weakref.WeakSet()
+MAPPED_PATHS = set()
+
+def forget_process_files():
+    MAPPED_PATHS.clear()
+    for process_file in list(PROCESS_FILES):
+        process_file.forget_file()
+
+def close_process_files():
+    for process_file in list(PROCESS_FILES):
+        if process_file.path:
+            process_file.close_file()
+
+os.register_at_fork(after_in_child=forget_process_files)
+atexit.register(close_process_files)
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_value(value):
+    return repr(int(value)) if value == int(value) else repr(value)
+
+class Metrics(ProcessFile):
+    """Per-route request counts and latency histograms, /get-price outcomes and snapshot gauges"""
+
+    def __init__(self, routes, directory=METRICS_DIR):
+        self.routes = sorted(set(routes)) + [UNMATCHED_ROUTE]
+
+        # Per route: one count per status class, histogram buckets (the last is +Inf), latency sum
+        self.route_width = len(STATUS_CLASSES) + len(LATENCY_BUCKETS) + 2
+        self.route_slots = {route: i * self.route_width for i, route in enumerate(self.routes)}
+        self.outcome_slots = {
+            outcome: len(self.routes) * self.route_width + i
+            for i, outcome in enumerate(PRICE_OUTCOMES.values())
+        }
+        self.gauge_slots = {
+            gauge: len(self.routes) * self.route_width + len(PRICE_OUTCOMES) + i
+            for i, gauge in enumerate(SNAPSHOT_GAUGES)
+        }
+        self.log_slots = {
+            result: len(self.routes) * self.route_width + len(PRICE_OUTCOMES) + len(SNAPSHOT_GAUGES) + i
+            for i, result in enumerate(REQUEST_LOG_RESULTS)
+        }
+        self.slot_count = (len(self.routes) * self.route_width + len(PRICE_OUTCOMES) + len(SNAPSHOT_GAUGES) +
+                           len(REQUEST_LOG_RESULTS))
+        # Apps (or builds) with other route lists never mix their files with ours
+        layout = hashlib.blake2b('\n'.join(self.routes).encode('utf-8'), digest_size=4).hexdigest()
+        super().__init__(directory, layout, VERSION_BYTES + self.slot_count * DOUBLE)
+
+    def forget_file(self):
+        super().forget_file()
+        self.values = None
+        self.snapshot = None
+        self.log_counts = (0, 0)
+
+    def open_file(self):
+        """Map this process's file, created on its first request"""
+        self.values = memoryview(super().open_file())[VERSION_BYTES:].cast('d')
+        return self.values
+
+    def observe_request(self, route, status, seconds):
+        """Count one response and its latency; /get-price also counts its outcome"""
+        base = self.route_slots.get(route)
+        if base is None:
+            base = self.route_slots[UNMATCHED_ROUTE]
+        status_slot = base + min(max(status // 100, 1), 5) - 1
+        bucket_slot = base + len(STATUS_CLASSES) + bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        outcome_slot = self.outcome_slots.get(PRICE_OUTCOMES.get(status)) if route == '/get-price' else None
+
+        with self.lock:
+            values = self.values or self.open_file()
+            values[status_slot] += 1
+            values[bucket_slot] += 1
+            values[base + self.route_width - 1] += seconds
+            if outcome_slot is not None:
+                values[outcome_slot] += 1
+
+    def observe_snapshot(self, snapshot):
+        """Record the snapshot this process serves; a cheap identity check when nothing changed"""
+        if snapshot is self.snapshot or not snapshot:
+            return
+        with self.lock:
+            values = self.values or self.open_file()
+            values[self.gauge_slots['load_seconds']] = snapshot['load_seconds']
+            values[self.gauge_slots['records']] = snapshot['total_records']
+            values[self.gauge_slots['loaded_timestamp_seconds']] = snapshot['loaded_at']
+            self.buffer[:VERSION_BYTES] = snapshot['version'].encode('ascii').ljust(VERSION_BYTES, b'\0')
+            self.snapshot = snapshot
+
+    def observe_request_log(self, written, dropped):
+        """Copy this process's request log counts (see request_log.py); a tuple compare when unchanged"""
+        if (written, dropped) == self.log_counts:
+            return
+        with self.lock:
+            values = self.values or self.open_file()
+            values[self.log_slots['written']] = written
+            values[self.log_slots['dropped']] = dropped
+            self.log_counts = (written, dropped)
+
+    def render(self):
+        """All live workers' metrics in the Prometheus text exposition format"""
+        totals = [0.0] * self.slot_count
+        live = []
+        for pid, contents in self.read_files():
+            values = array('d')
+            values.frombytes(contents[VERSION_BYTES:])
+            for i, value in enumerate(values):
+                totals[i] += value
+            version = contents[:VERSION_BYTES].rstrip(b'\0').decode('ascii', 'replace')
+            if version:
+                live.append((pid, version, values))
+
+        lines = [
+            '# HELP pricing_http_requests_total Requests handled, by route and status class.',
+            '# TYPE pricing_http_requests_total counter'
+        ]
+        for route in self.routes:
+            base = self.route_slots[route]
+            for i, status in enumerate(STATUS_CLASSES):
+                if totals[base + i]:
+                    lines.append(f'pricing_http_requests_total{{route="{escape(route)}",status="{status}"}} {format_value(totals[base + i])}')
+
+        lines += [
+            '# HELP pricing_http_request_duration_seconds Time spent handling a request, by route.',
+            '# TYPE pricing_http_request_duration_seconds histogram'
+        ]
+        for route in self.routes:
+            base = self.route_slots[route] + len(STATUS_CLASSES)
+            counts = totals[base:base + len(LATENCY_BUCKETS) + 1]
+            if not any(counts):
+                continue
+            label = escape(route)
+            cumulative = 0.0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'pricing_http_request_duration_seconds_bucket{{route="{label}",le="{bound}"}} {format_value(cumulative)}')
+            lines.append(f'pricing_http_request_duration_seconds_sum{{route="{label}"}} {totals[base + len(counts)]!r}')
+            lines.append(f'pricing_http_request_duration_seconds_count{{route="{label}"}} {format_value(cumulative)}')
+
+        lines += [
+            '# HELP pricing_price_lookups_total /get-price results: hit, miss (with suggestions), invalid request, error.',
+            '# TYPE pricing_price_lookups_total counter'
+        ]
+        for outcome, slot in self.outcome_slots.items():
+            lines.append(f'pricing_price_lookups_total{{outcome="{outcome}"}} {format_value(totals[slot])}')
+
+        lines += [
+            '# HELP pricing_request_log_entries_total /get-price log entries written, or dropped because the queue was full or the write failed.',
+            '# TYPE pricing_request_log_entries_total counter'
+        ]
+        for result, slot in self.log_slots.items():
+            lines.append(f'pricing_request_log_entries_total{{result="{result}"}} {format_value(totals[slot])}')
+
+        # Gauges are per live worker - during a reload workers briefly disagree
+        gauge_help = {
+            'load_seconds': 'Seconds it took to build the snapshot this worker serves.',
+            'records': 'Price records in the snapshot this worker serves.',
+            'loaded_timestamp_seconds': 'Unix time the snapshot this worker serves was built.'
+        }
+        for gauge, slot in self.gauge_slots.items():
+            lines += [f'# HELP pricing_snapshot_{gauge} {gauge_help[gauge]}', f'# TYPE pricing_snapshot_{gauge} gauge']
+            lines += [f'pricing_snapshot_{gauge}{{pid="{pid}"}} {format_value(values[slot])}' for pid, _, values in live]
+        lines += [
+            '# HELP pricing_snapshot_info Content hash of the snapshot each worker serves.',
+            '# TYPE pricing_snapshot_info gauge'
+        ]
+        lines += [f'pricing_snapshot_info{{pid="{pid}",version="{escape(version)}"}} 1' for pid, version, _ in live]
+
+        return ('\n'.join(lines) + '\n').encode('utf-8')
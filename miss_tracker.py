@@ -0,0 +1,146 @@
+"""
+Most-requested missing cars, counted in fixed memory and merged across gunicorn workers.
+
+Every /get-price miss adds its normalized (fuel, brand, model) key to a
+count-min sketch: DEPTH rows of WIDTH counters, one counter per row picked
+by a hash of the key. The estimate for a key is the smallest of its DEPTH
+counters, which can only overcount, by at most about e / WIDTH of all
+misses. Next to the sketch, each worker keeps the CANDIDATES keys with the
+highest estimates seen so far (the heavy-hitter candidates, each stored as a
+fixed-size slot).
+
+Like metrics.py, each process writes into its own mmap'd file,
+METRICS_DIR/misses-<pid>.metrics, so a miss costs one hash and a few memory
+stores and never a syscall. Sketches merge by adding their counters, so
+top() sums every worker's sketch, re-estimates the union of all candidates
+against the sum and returns the K largest. Memory is the same after ten
+misses or ten million. A worker's misses leave the counts when it exits,
+like its metrics (see metrics.ProcessFile).
+"""
+
+import hashlib
+import struct
+from array import array
+
+from metrics import METRICS_DIR, ProcessFile
+
+WIDTH = 4096
+DEPTH = 4
+CANDIDATES = 256
+SLOT_BYTES = 128
+KEY_SEPARATOR = '\x1f'
+
+COUNTER = array('I').itemsize
+HEADER = struct.Struct('<Q')    # total misses
+SLOT_LENGTH = struct.Struct('<H')
+SKETCH_OFFSET = HEADER.size
+SLOTS_OFFSET = SKETCH_OFFSET + WIDTH * DEPTH * COUNTER
+FILE_SIZE = SLOTS_OFFSET + CANDIDATES * SLOT_BYTES
+
+def encode_key(key):
+    """Slot bytes for a key; an unknown fuel (no alias matched) is stored as an empty string"""
+    encoded = KEY_SEPARATOR.join(part or '' for part in key).encode('utf-8')
+    return encoded[:SLOT_BYTES - SLOT_LENGTH.size]
+
+def decode_key(encoded):
+    fuel, brand, model = (encoded.decode('utf-8', 'replace').split(KEY_SEPARATOR) + ['', ''])[:3]
+    return fuel or None, brand, model
+
+def positions(encoded):
+    """One counter index per sketch row, from a single 16-byte hash"""
+    hashes = struct.unpack('<4I', hashlib.blake2b(encoded, digest_size=16).digest())
+    return [row * WIDTH + hashes[row] % WIDTH for row in range(DEPTH)]
+
+class MissTracker(ProcessFile):
+    """Count-min sketch plus top candidates of /get-price misses, per process"""
+
+    def __init__(self, directory=METRICS_DIR):
+        super().__init__(directory, 'misses', FILE_SIZE)
+
+    def forget_file(self):
+        super().forget_file()
+        self.counters = None
+        self.candidates = {}    # encoded key -> (slot, estimate)
+        self.floor = 0          # lowest candidate estimate once every slot is taken
+
+    def open_file(self):
+        self.counters = memoryview(super().open_file())[SKETCH_OFFSET:SLOTS_OFFSET].cast('I')
+        return self.counters
+
+    def observe(self, key):
+        """Count one missed (fuel, brand, model) key"""
+        encoded = encode_key(key)
+        cells = positions(encoded)
+        with self.lock:
+            counters = self.counters or self.open_file()
+            for cell in cells:
+                counters[cell] += 1
+            estimate = min(counters[cell] for cell in cells)
+            HEADER.pack_into(self.buffer, 0, HEADER.unpack_from(self.buffer, 0)[0] + 1)
+
+            if encoded in self.candidates:
+                slot, _ = self.candidates[encoded]
+            elif len(self.candidates) < CANDIDATES:
+                slot = len(self.candidates)
+            else:
+                # Stored estimates only grow, so the cached minimum is a lower bound:
+                # the long tail of one-off misses stops at this comparison
+                if estimate <= self.floor:
+                    return
+                # Replace the weakest candidate only when this key still outranks it
+                weakest, (slot, _) = min(self.candidates.items(), key=lambda item: item[1][1])
+                weakest_estimate = min(counters[cell] for cell in positions(weakest))
+                if estimate <= weakest_estimate:
+                    self.candidates[weakest] = (slot, weakest_estimate)
+                    self.floor = min(estimate for _, estimate in self.candidates.values())
+                    return
+                del self.candidates[weakest]
+            if encoded in self.candidates:
+                self.candidates[encoded] = (slot, estimate)
+                return
+            offset = SLOTS_OFFSET + slot * SLOT_BYTES
+            SLOT_LENGTH.pack_into(self.buffer, offset, len(encoded))
+            self.buffer[offset + SLOT_LENGTH.size:offset + SLOT_LENGTH.size + len(encoded)] = encoded
+            self.candidates[encoded] = (slot, estimate)
+            if len(self.candidates) == CANDIDATES:
+                self.floor = min(estimate for _, estimate in self.candidates.values())
+
+    def read_sketches(self):
+        """(total, counters, candidate keys) for every live process that has seen a miss"""
+        for _, contents in self.read_files():
+            counters = array('I')
+            counters.frombytes(contents[SKETCH_OFFSET:SLOTS_OFFSET])
+            keys = []
+            for offset in range(SLOTS_OFFSET, FILE_SIZE, SLOT_BYTES):
+                length = SLOT_LENGTH.unpack_from(contents, offset)[0]
+                if length:
+                    keys.append(contents[offset + SLOT_LENGTH.size:offset + SLOT_LENGTH.size + length])
+            yield HEADER.unpack_from(contents, 0)[0], counters, keys
+
+    def top(self, limit=50):
+        """The most-missed keys across all workers, with estimated counts"""
+        total = 0
+        workers = 0
+        merged = [0] * (WIDTH * DEPTH)
+        candidates = set()
+        for count, counters, keys in self.read_sketches():
+            total += count
+            workers += 1
+            merged = [a + b for a, b in zip(merged, counters)]
+            candidates.update(keys)
+
+        estimates = sorted(
+            ((min(merged[cell] for cell in positions(encoded)), encoded) for encoded in candidates),
+            key=lambda item: (-item[0], item[1])
+        )
+        misses = []
+        for estimate, encoded in estimates[:limit]:
+            fuel, brand, model = decode_key(encoded)
+            misses.append({"fuel_type": fuel, "brand": brand, "model": model, "count": estimate})
+        return {
+            "total_misses": total,
+            "workers": workers,
+            # Count-min estimates never undercount; this bounds the overcount (with ~98% confidence)
+            "max_overcount": int(total * 2.72 / WIDTH) if total else 0,
+            "misses": misses
+        }
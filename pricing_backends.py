@@ -0,0 +1,155 @@
+"""
+Lookup backends for the pricing store.
+
+Every backend answers the same question - the record for a canonical
+(fuel, brand, model) key - from the same cleaned records of one snapshot,
+so switching backends changes speed and memory, never answers. The backend
+is chosen with PRICING_BACKEND (or PricingStore(backend=...)):
+
+  index   one hash probe into pre-rendered response bodies (default)
+  list    linear scan over the records, app_simple.py's original strategy
+  pandas  a DataFrame under a sorted key MultiIndex (app.py's engine), with
+          vectorized bulk lookups for whole DataFrames of queries
+"""
+
+from pricing_index import PRICE_FIELDS, canonical, catalog_key, render_price_body
+
+KEY_COLUMNS = ('fuel_key', 'brand_key', 'model_key')
+QUERY_COLUMNS = ('FuelType', 'CarManufacturer', 'CarModel')
+RECORD_COLUMNS = ('original_fuel', 'original_brand', 'original_model') + PRICE_FIELDS
+
+class LookupBackend:
+    """Finds records for canonical keys; subclasses implement find()"""
+
+    name = None
+
+    def find(self, key):
+        """Record dict for a (fuel, brand, model) key, or None"""
+        raise NotImplementedError
+
+    def response(self, key):
+        """(body, Content-Length) of the /get-price success response, or None"""
+        record = self.find(key)
+        return render_price_body(record) if record is not None else None
+
+    def responses(self, keys):
+        """response() for many keys - backends with a cheaper bulk path override this"""
+        return [self.response(key) for key in keys]
+
+class IndexBackend(LookupBackend):
+    name = 'index'
+
+    def __init__(self, snapshot):
+        self.index = snapshot['index']
+        self.rendered = snapshot['responses']
+
+    def find(self, key):
+        return self.index.get(key)
+
+    def response(self, key):
+        return self.rendered.get(key)
+
+class ListBackend(LookupBackend):
+    name = 'list'
+
+    def __init__(self, snapshot):
+        self.records = list(snapshot['index'].values())
+
+    def find(self, key):
+        fuel, brand, model = key
+        if fuel is None:
+            return None
+        for record in self.records:
+            if catalog_key(record) == key:
+                return record
+        return None
+
+class PandasBackend(LookupBackend):
+    """
+    The catalog as a DataFrame indexed by its canonical (fuel, brand, model) key.
+
+    Key columns and the sorted MultiIndex are built once per snapshot, so a single
+    lookup is an index probe. responses() and lookup_frame() answer many queries with
+    one merge against the catalog.
+    """
+
+    name = 'pandas'
+
+    def __init__(self, snapshot):
+        # Imported here so the other backends never pay for pandas
+        import pandas as pd
+
+        self.pd = pd
+        self.records = list(snapshot['index'].values())
+        self.fuel_aliases = snapshot['fuel_aliases']
+        self.brand_aliases = {alias: brand for alias, brand in snapshot['name_aliases'].items() if isinstance(alias, str)}
+        # (brand key, model alias) -> model key, flattened so a string column can be mapped through it
+        self.model_aliases = {
+            f'{alias[0]}\x1f{alias[1]}': model
+            for alias, model in snapshot['name_aliases'].items() if isinstance(alias, tuple)
+        }
+
+        keys = list(snapshot['index'])
+        columns = {name: [key[i] for key in keys] for i, name in enumerate(KEY_COLUMNS)}
+        for column in RECORD_COLUMNS:
+            values = [record[column] for record in self.records]
+            # Nullable integers keep whole-rupee prices (and #N/A as <NA>) instead of floats
+            columns[column] = pd.array(values, dtype='Int64') if column in PRICE_FIELDS else values
+        columns['row'] = range(len(keys))
+        self.frame = pd.DataFrame(columns).set_index(list(KEY_COLUMNS)).sort_index()
+        self.rows = self.frame['row'].to_numpy()
+
+    def find(self, key):
+        if key[0] is None:
+            return None
+        try:
+            position = self.frame.index.get_loc(key)
+        except KeyError:
+            return None
+        return self.records[self.rows[position]]
+
+    def match(self, keys):
+        """Row number (or None) for each key column triple of `keys`, a DataFrame, in one merge"""
+        matched = keys.merge(self.frame[['row']], how='left', left_on=list(KEY_COLUMNS), right_index=True)
+        return [None if self.pd.isna(row) else int(row) for row in matched['row']]
+
+    def responses(self, keys):
+        keys = self.pd.DataFrame(list(keys), columns=list(KEY_COLUMNS))
+        return [None if row is None else render_price_body(self.records[row]) for row in self.match(keys)]
+
+    def query_keys(self, queries):
+        """Key columns for raw FuelType/CarManufacturer/CarModel columns, canonicalized once per distinct value"""
+        pd = self.pd
+
+        def canonical_column(column):
+            values = queries[column].fillna('').astype(str)
+            distinct = values.unique()
+            return values.map(dict(zip(distinct, map(canonical, distinct))))
+
+        fuel = canonical_column('FuelType').map(self.fuel_aliases)
+        brand = canonical_column('CarManufacturer')
+        brand = brand.map(self.brand_aliases).fillna(brand)
+        model = canonical_column('CarModel')
+        model = (brand + '\x1f' + model).map(self.model_aliases).fillna(model)
+        return pd.DataFrame({'fuel_key': fuel, 'brand_key': brand, 'model_key': model}, index=queries.index)
+
+    def lookup_frame(self, queries):
+        """
+        Price a whole DataFrame of queries (FuelType, CarManufacturer, CarModel columns, as
+        /get-price takes them) in one merge. Returns the queries with the key columns, the
+        catalog's names and prices, and `matched`.
+        """
+        keyed = queries.join(self.query_keys(queries))
+        priced = keyed.merge(self.frame, how='left', left_on=list(KEY_COLUMNS), right_index=True)
+        priced['matched'] = priced['row'].notna()
+        return priced.drop(columns='row')
+
+BACKENDS = {backend.name: backend for backend in (IndexBackend, ListBackend, PandasBackend)}
+
+def create_backend(name, snapshot):
+    """Build the named backend over a loaded snapshot"""
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown pricing backend {name!r}, expected one of: {', '.join(BACKENDS)}")
+    return backend(snapshot)
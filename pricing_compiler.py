@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Compile the pricing sheet (CSV) into pricing_data.json.
+
+The CSV is streamed row by row. Each row is hashed, and rows whose hash was
+seen in the previous run, under the same header, reuse their compiled record
+from the row cache (pricing_data.rows.json) instead of being parsed and
+validated again. When no row changed and the output exists it is not
+rewritten at all, so running workers see no file change and do not reload.
+
+The sheet's fuel types are renamed the way update_fuel_types.py renamed them
+in pricing_data.json (petrol -> Petrol/CNG, cng -> EV), so a compile gives
+the same data the service has been serving. A pricing_data.json that was
+edited after it was compiled (by hand, or by update_ev_dent_paint.py) is not
+overwritten: the edit would be lost on every recompile, so the compile fails
+and names the records, and --force overwrites them. Put such changes in the
+sheet or in pricing_rules.txt instead.
+
+Every run reports what a sheet edit can get wrong:
+  - missing columns or empty fuel/brand/model cells (rows skipped)
+  - duplicate (fuel, brand, model) keys, including ones that only differ in
+    case or spacing and would otherwise silently overwrite each other
+  - #N/A, blank and unparseable price cells
+
+Outputs are written to a temporary file and renamed into place, so a crash
+or a bad sheet never leaves a half-written pricing_data.json behind.
+
+Usage: python pricing_compiler.py [sheet.csv] [pricing_data.json] [--strict] [--force]
+"""
+
+import csv
+import hashlib
+import json
+import os
+import sys
+from collections import Counter, defaultdict
+
+from pricing_index import catalog_key
+
+CSV_FILE = 'GM Pricing March Website Usage -Final.csv'
+DATA_FILE = 'pricing_data.json'
+ROW_CACHE_VERSION = 3
+
+KEY_COLUMNS = ('FuelType', 'Car Brand', 'Car Model')
+
+# Sheet fuel type -> the name it is served under, as update_fuel_types.py renamed them
+FUEL_TYPE_NAMES = {'petrol': 'Petrol/CNG', 'diesel': 'Diesel', 'cng': 'EV'}
+PROBLEM_LABELS = {'not_available': '#N/A', 'blank': 'blank', 'invalid': 'unparseable'}
+
+# CSV column -> record field
+PRICE_COLUMNS = {
+    'Periodic Service Price GaadiMech': 'periodic_service',
+    'Express Service Price GaadiMech': 'express_service',
+    'Discounted Price': 'discounted_price',
+    'Comprehensive Service Price GaadiMech': 'comprehensive_service',
+    'Dent & Paint Price GaadiMech': 'dent_paint',
+    'Dent and Paint Full Body': 'full_body_paint'
+}
+
+def parse_price(price_str):
+    """(price as int or None, problem or None) - problem is 'not_available', 'blank' or 'invalid'"""
+    if price_str is None or price_str.strip() == '':
+        return None, 'blank'
+    if price_str.strip() == '#N/A':
+        return None, 'not_available'
+    try:
+        cleaned = ''.join(c for c in str(price_str) if c.isdigit() or c == '.')
+        if cleaned:
+            return int(float(cleaned)), None
+    except ValueError:
+        pass
+    return None, 'invalid'
+
+def clean_price(price_str):
+    """Price cell from the CSV as an int, or None for blanks and #N/A - the one place prices are parsed"""
+    return parse_price(price_str)[0]
+
+def row_hash(header, row):
+    """Cache key for a row; the header is part of it, since the same cells under reordered columns are a different record"""
+    return hashlib.blake2b('\x1f'.join(header + ['\x1e'] + row).encode('utf-8'), digest_size=16).hexdigest()
+
+def tree_key(record):
+    """(fuel, brand, model) keys of a record in the data tree; renamed fuel types keep their capitals"""
+    fuel = record['original_fuel']
+    fuel = fuel if fuel in FUEL_TYPE_NAMES.values() else fuel.lower()
+    return fuel, record['original_brand'].lower(), record['original_model'].lower()
+
+def compile_row(header_index, row):
+    """(record, [(column, problem)]) for one CSV row"""
+    cells = {column: row[i] if i < len(row) else '' for column, i in header_index.items()}
+    record = {
+        'original_fuel': FUEL_TYPE_NAMES.get(cells['FuelType'].strip().lower(), cells['FuelType']),
+        'original_brand': cells['Car Brand'],
+        'original_model': cells['Car Model']
+    }
+    problems = []
+    for column, field in PRICE_COLUMNS.items():
+        record[field], problem = parse_price(cells[column])
+        if problem:
+            problems.append((column, problem))
+    return record, problems
+
+def row_cache_path(data_file):
+    return os.path.splitext(data_file)[0] + '.rows.json'
+
+def load_row_cache(path):
+    """(rows, digest of the data file the last compile wrote)"""
+    try:
+        with open(path, 'r') as f:
+            cache = json.load(f)
+        if cache.get('version') == ROW_CACHE_VERSION:
+            return cache['rows'], cache.get('output')
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    return {}, None
+
+def contents_digest(contents):
+    return hashlib.blake2b(contents.encode('utf-8'), digest_size=16).hexdigest()
+
+def edited_records(data_file, data):
+    """Tree keys of the records in `data_file` that differ from `data`, the tree about to replace it"""
+    def records(tree):
+        return {(fuel, brand, model): record for fuel, brands in tree.items()
+                for brand, models in brands.items() for model, record in models.items()}
+    try:
+        with open(data_file, 'r', encoding='utf-8') as f:
+            contents = f.read()
+        existing = records(json.loads(contents)['data'])
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        # Unreadable or not a pricing tree: nothing in it to keep
+        return contents_digest(''), []
+    current = records(data)
+    return contents_digest(contents), sorted(key for key in existing.keys() | current.keys() if existing.get(key) != current.get(key))
+
+def write_atomically(path, contents):
+    """Write to a temp file in the same directory, fsync, then rename over `path`"""
+    temp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(contents)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+class CompileReport:
+    """Everything worth telling whoever edited the sheet"""
+
+    def __init__(self):
+        self.rows = 0
+        self.reused = 0
+        self.errors = []
+        self.duplicates = []
+        self.price_problems = Counter()
+        self.price_problem_rows = defaultdict(list)
+        self.written = False
+
+    @property
+    def not_available(self):
+        return sum(count for (_, problem), count in self.price_problems.items() if problem == 'not_available')
+
+    def print_summary(self):
+        print(f"📄 {self.rows} rows ({self.reused} unchanged since the last compile)")
+        for message in self.errors:
+            print(f"❌ {message}")
+        for line, first_line, key, exact in self.duplicates:
+            kind = "duplicate of" if exact else "collides with"
+            print(f"⚠️ Line {line}: {' / '.join(key)} {kind} line {first_line} - line {line} wins")
+        for (column, problem), count in sorted(self.price_problems.items()):
+            lines = self.price_problem_rows[(column, problem)]
+            sample = ', '.join(str(line) for line in lines[:5]) + (' ...' if len(lines) > 5 else '')
+            print(f"ℹ️ {count} {PROBLEM_LABELS[problem]} cells in '{column}' (lines {sample})")
+        if self.price_problems:
+            print(f"ℹ️ {self.not_available} #N/A price cells in total, served as \"Not Available\"")
+
+def compile_pricing(csv_file=CSV_FILE, data_file=DATA_FILE, strict=False, force=False):
+    """
+    Compile the sheet into the JSON snapshot: (result dict or None, CompileReport).
+
+    With `strict`, duplicate keys and unparseable prices are errors too. Nothing
+    is written when there are errors, or when no row changed (unless `force`).
+    """
+    report = CompileReport()
+    cache_file = row_cache_path(data_file)
+    previous_rows, previous_output = load_row_cache(cache_file)
+    current_rows = {}
+
+    optimized = {}
+    brands = set()
+    fuel_types = set()
+    first_seen = {}
+
+    with open(csv_file, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = [column.strip() for column in next(reader, [])]
+        header_index = {column: i for i, column in enumerate(header)}
+        missing = [column for column in KEY_COLUMNS + tuple(PRICE_COLUMNS) if column not in header_index]
+        if missing:
+            report.errors.append(f"Missing columns: {', '.join(missing)}")
+            return None, report
+
+        for line, row in enumerate(reader, start=2):
+            if not any(cell.strip() for cell in row):
+                continue
+            report.rows += 1
+
+            digest = row_hash(header, row)
+            cached = previous_rows.get(digest)
+            if cached:
+                record, problems = cached['record'], [tuple(problem) for problem in cached['problems']]
+                report.reused += 1
+            else:
+                record, problems = compile_row(header_index, row)
+            current_rows[digest] = {'record': record, 'problems': problems}
+
+            if not all(record[field].strip() for field in ('original_fuel', 'original_brand', 'original_model')):
+                report.errors.append(f"Line {line}: FuelType, Car Brand and Car Model are all required")
+                continue
+
+            for problem in problems:
+                report.price_problems[problem] += 1
+                report.price_problem_rows[problem].append(line)
+                if strict and problem[1] == 'invalid':
+                    report.errors.append(f"Line {line}: unparseable price in '{problem[0]}'")
+
+            fuel, brand, model = tree_key(record)
+
+            # Lookups match on canonical keys, so "Swift Dzire" and "swift-dzire" are the same car
+            key = catalog_key(record)
+            if key in first_seen:
+                first_line, first_record = first_seen[key]
+                exact = all(first_record[field] == record[field] for field in ('original_fuel', 'original_brand', 'original_model'))
+                report.duplicates.append((line, first_line, key, exact))
+                if strict:
+                    report.errors.append(f"Line {line}: duplicate key {' / '.join(key)} (first on line {first_line})")
+                # Drop the earlier entry wherever its spelling put it
+                first_tree_key = tree_key(first_record)
+                optimized[first_tree_key[0]][first_tree_key[1]].pop(first_tree_key[2], None)
+            first_seen[key] = (line, record)
+
+            fuel_types.add(record['original_fuel'])
+            brands.add(record['original_brand'])
+            optimized.setdefault(fuel, {}).setdefault(brand, {})[model] = record
+
+    if report.errors:
+        return None, report
+
+    # Drop brands/fuels emptied by duplicates
+    for fuel in list(optimized):
+        for brand in list(optimized[fuel]):
+            if not optimized[fuel][brand]:
+                del optimized[fuel][brand]
+        if not optimized[fuel]:
+            del optimized[fuel]
+
+    result = {
+        'data': optimized,
+        'brands': sorted(brands),
+        'fuel_types': sorted(fuel_types),
+        'total_records': sum(len(models) for brand_data in optimized.values() for models in brand_data.values())
+    }
+
+    unchanged = (
+        not force and
+        set(current_rows) == set(previous_rows) and
+        report.reused == report.rows and
+        os.path.exists(data_file) and os.path.getsize(data_file) > 0
+    )
+    if unchanged:
+        return result, report
+
+    # A data file this compiler didn't write last time may carry edits the sheet doesn't have
+    if not force and os.path.exists(data_file) and os.path.getsize(data_file) > 0:
+        digest, edited = edited_records(data_file, optimized)
+        if edited and digest != previous_output:
+            sample = ', '.join(' / '.join(key) for key in edited[:3]) + (' ...' if len(edited) > 3 else '')
+            report.errors.append(
+                f"{data_file} was changed since it was compiled and {len(edited)} records differ from the sheet "
+                f"({sample}). Move edits made by hand or by update_*.py scripts into the sheet or "
+                f"pricing_rules.txt, or rerun with --force to overwrite them"
+            )
+            return None, report
+
+    contents = json.dumps(result, separators=(',', ':'))
+    write_atomically(data_file, contents)
+    write_atomically(cache_file, json.dumps(
+        {'version': ROW_CACHE_VERSION, 'output': contents_digest(contents), 'rows': current_rows}, separators=(',', ':')
+    ))
+    report.written = True
+    return result, report
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    source = args[0] if len(args) > 0 else CSV_FILE
+    target = args[1] if len(args) > 1 else DATA_FILE
+
+    result, report = compile_pricing(source, target, strict='--strict' in sys.argv, force='--force' in sys.argv)
+    report.print_summary()
+    if result is None:
+        print(f"❌ {target} left untouched")
+        sys.exit(1)
+    if report.written:
+        print(f"✅ Compiled {result['total_records']} records into {target}")
+    else:
+        print(f"✅ {target} is already up to date")
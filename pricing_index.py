@@ -0,0 +1,294 @@
+"""
+Load-time lookup structures for the GaadiMech pricing webhook.
+
+Everything here is built once per loaded snapshot so the request path is
+one canonicalization plus a hash probe.
+"""
+
+import gzip
+import hashlib
+import json
+import unicodedata
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Quality 11 squeezes the export another ~10% but takes ~0.5s per load instead of ~10ms
+BROTLI_QUALITY = 9
+
+# Price columns of a record, in sheet order
+PRICE_FIELDS = (
+    'periodic_service',
+    'express_service',
+    'discounted_price',
+    'comprehensive_service',
+    'dent_paint',
+    'full_body_paint'
+)
+
+# Every fuel spelling we accept -> canonical fuel candidates, most preferred first.
+# update_fuel_types.py renamed "petrol" to "Petrol/CNG", so old and new spellings
+# both resolve to whichever of the candidates the loaded data actually has.
+# Keys are canonical spellings ("petrol/cng", "Petrol CNG" and "petrol+cng" are all "petrolcng")
+FUEL_ALIASES = {
+    'petrol': ('petrol', 'petrol/cng'),
+    'petrolcng': ('petrol/cng', 'petrol'),
+    'cng': ('cng', 'petrol/cng'),
+    'diesel': ('diesel',),
+    'ev': ('ev', 'electric'),
+    'electric': ('electric', 'ev'),
+}
+
+# What customers call a brand -> the brand as the sheet spells it
+BRAND_ALIASES = {
+    'Maruti Suzuki': 'Maruti',
+    'Suzuki': 'Maruti',
+    'Mercedes-Benz': 'Mercedes',
+    'Benz': 'Mercedes',
+    'VW': 'Volkswagen',
+    'Chevy': 'Chevrolet',
+    'MG Motor': 'MG',
+    'Morris Garages': 'MG',
+}
+
+# (brand, what customers call a model) -> the model as the sheet spells it.
+# Spelling variants ("Alto K-10", "A Star", "Swift  Dzire") need no entry: canonical() folds them.
+MODEL_ALIASES = {
+    ('Maruti', 'Dzire'): 'Swift Dzire',
+    ('Maruti', 'K10'): 'Alto K10',
+    ('Maruti', 'Brezza'): 'Vitara Brezza',
+    ('Maruti', 'Alto 800'): 'Alto',
+    ('Hyundai', 'i20'): 'Elite-i20',
+    ('Hyundai', 'i20 Elite'): 'Elite-i20',
+    ('Hyundai', 'Grand i10 Nios'): 'Grand-i10',
+    ('Hyundai', 'Nios'): 'Grand-i10',
+    ('Toyota', 'Crysta'): 'Innova Crysta',
+    ('Toyota', 'Altis'): 'Corolla-Altis',
+    ('Toyota', 'Liva'): 'Etios Liva',
+    ('Tata', 'Nexon EV'): 'Nexon',
+    ('Tata', 'Tigor EV'): 'Tigor',
+    ('Tata', 'Tiago EV'): 'Tiago',
+    ('Mahindra', 'Scorpio N'): 'Scorpio',
+    ('Mahindra', 'Scorpio Classic'): 'Scorpio',
+}
+
+def normalize(text):
+    """Case-fold and collapse whitespace - for display-friendly keys and prefix search"""
+    return ' '.join(text.lower().split())
+
+def canonical(text):
+    """Case, accents, punctuation and spacing folded away: "Alto K-10" and "alto  k10" are both "altok10\""""
+    text = text.lower()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+    return ''.join(filter(str.isalnum, text))
+
+def build_fuel_aliases(fuel_types):
+    """Map every accepted fuel spelling (canonical) to the fuel key present in the data"""
+    available = {canonical(fuel): normalize(fuel) for fuel in fuel_types}
+    keys = set(available.values())
+    aliases = dict(available)
+
+    for spelling, candidates in FUEL_ALIASES.items():
+        if spelling in aliases:
+            continue
+        for candidate in candidates:
+            if candidate in keys:
+                aliases[spelling] = candidate
+                break
+
+    return aliases
+
+def catalog_key(record):
+    """The index key of a record: normalized fuel, canonical brand and model"""
+    return (
+        normalize(record['original_fuel']),
+        canonical(record['original_brand']),
+        canonical(record['original_model'])
+    )
+
+def build_index(data):
+    """Flatten fuel -> brand -> model into one dict keyed by catalog_key()"""
+    index = {}
+    for fuel_data in data.values():
+        for brand_data in fuel_data.values():
+            for record in brand_data.values():
+                index[catalog_key(record)] = record
+    return index
+
+def build_name_aliases(index):
+    """
+    The curated brand and model aliases that apply to this catalog, canonicalized once
+    per load: brand alias -> brand key, (brand key, model alias) -> model key. An alias
+    whose target is missing, or that is itself a real entry, is left out.
+    """
+    brands = {brand for _, brand, _ in index}
+    models = {(brand, model) for _, brand, model in index}
+    aliases = {}
+    for alias, brand in BRAND_ALIASES.items():
+        alias, brand = canonical(alias), canonical(brand)
+        if brand in brands and alias not in brands:
+            aliases[alias] = brand
+    for (brand, alias), model in MODEL_ALIASES.items():
+        brand, alias, model = canonical(brand), canonical(alias), canonical(model)
+        if (brand, model) in models and (brand, alias) not in models:
+            aliases[(brand, alias)] = model
+    return aliases
+
+def fuel_key(fuel_aliases, fuel_type):
+    """The data's fuel key for any accepted spelling, or None"""
+    return fuel_aliases.get(canonical(fuel_type))
+
+def make_key(fuel_aliases, fuel_type, car_manufacturer, car_model, name_aliases=None):
+    """Canonicalize request fields into an index key: one pass per field plus alias lookups"""
+    brand = canonical(car_manufacturer)
+    model = canonical(car_model)
+    if name_aliases:
+        brand = name_aliases.get(brand, brand)
+        model = name_aliases.get((brand, model), model)
+    return (fuel_key(fuel_aliases, fuel_type), brand, model)
+
+def dump_json(obj):
+    """Encode exactly like Flask's jsonify() outside debug mode: compact, sorted keys, trailing newline"""
+    return (json.dumps(obj, separators=(',', ':'), sort_keys=True) + "\n").encode('utf-8')
+
+def entity_tag(body):
+    """Strong ETag for a response body - changes exactly when the bytes do"""
+    return '"%s"' % hashlib.blake2b(body, digest_size=12).hexdigest()
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against our ETag, as RFC 9110 asks for GET"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate == etag:
+            return True
+    return False
+
+def compress_variants(body):
+    """
+    Content-coding -> (bytes, Content-Length, ETag) for a body, compressed once here.
+    
+    Each coding is its own representation with its own strong ETag; codings
+    that would not make the body smaller are left out.
+    """
+    variants = {'identity': (body, str(len(body)), entity_tag(body))}
+    encoded = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+    for coding, data in encoded.items():
+        if len(data) < len(body):
+            variants[coding] = (data, str(len(data)), entity_tag(data))
+    return variants
+
+def negotiate_encoding(accept_encoding, variants):
+    """Best pre-compressed variant the client accepts: (coding, (bytes, Content-Length, ETag)), else identity"""
+    if accept_encoding:
+        accepted = {}
+        for item in accept_encoding.split(','):
+            coding, _, params = item.partition(';')
+            quality = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[coding.strip().lower()] = quality
+        
+        for coding in ('br', 'gzip'):
+            if coding in variants and accepted.get(coding, accepted.get('*', 0.0)) > 0:
+                return coding, variants[coding]
+    
+    return 'identity', variants.get('identity')
+
+def render_catalog_body(obj):
+    """Every encoding of a catalog response that only changes with the data"""
+    return compress_variants(dump_json(obj))
+
+def format_price(price):
+    return str(price) if price is not None else "Not Available"
+
+def render_price_body(record):
+    """Serialize the /get-price success body for one record, byte-for-byte what jsonify() sends"""
+    response = {
+        "success": True,
+        "data": {
+            "car_details": {
+                "fuel_type": record['original_fuel'],
+                "brand": record['original_brand'],
+                "model": record['original_model']
+            },
+            "service_prices": {
+                "periodic_service": {
+                    "price": format_price(record['periodic_service']),
+                    "description": "Regular maintenance service"
+                },
+                "express_service": {
+                    "price": format_price(record['express_service']),
+                    "description": "Quick service option"
+                },
+                "discounted_price": {
+                    "price": format_price(record['discounted_price']),
+                    "description": "Special discounted rate"
+                },
+                "comprehensive_service": {
+                    "price": format_price(record['comprehensive_service']),
+                    "description": "Complete service package"
+                }
+            },
+            "paint_services": {
+                "dent_and_paint": {
+                    "price": format_price(record['dent_paint']),
+                    "description": "Dent repair and painting"
+                },
+                "full_body_paint": {
+                    "price": format_price(record['full_body_paint']),
+                    "description": "Complete body painting"
+                }
+            }
+        }
+    }
+    body = dump_json(response)
+    return body, str(len(body))
+
+def build_response_cache(index):
+    """Pre-render every success body once per load: index key -> (bytes, Content-Length)"""
+    return {key: render_price_body(record) for key, record in index.items()}
+
+def export_record(record):
+    """Public field names for one record in the catalog export"""
+    return {
+        "fuel_type": record['original_fuel'],
+        "brand": record['original_brand'],
+        "model": record['original_model'],
+        "periodic_service": record['periodic_service'],
+        "express_service": record['express_service'],
+        "discounted_price": record['discounted_price'],
+        "comprehensive_service": record['comprehensive_service'],
+        "dent_paint": record['dent_paint'],
+        "full_body_paint": record['full_body_paint']
+    }
+
+def iter_catalog_lines(data, fuel_key=None, brand_key=None):
+    """
+    Yield the catalog as NDJSON bytes, one chunk per brand partition.
+
+    Walks the fuel -> brand -> model tree lazily so the export is never held
+    in memory as a whole; `fuel_key`/`brand_key` filter on the index's keys.
+    """
+    for fuel, fuel_data in data.items():
+        if fuel_key is not None and normalize(fuel) != fuel_key:
+            continue
+        for brand, brand_data in fuel_data.items():
+            if brand_key is not None and canonical(brand) != brand_key:
+                continue
+            yield ''.join(
+                json.dumps(export_record(record), separators=(',', ':')) + "\n"
+                for record in brand_data.values()
+            ).encode('utf-8')
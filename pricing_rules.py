@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Declarative price rules, applied on top of the sheet whenever a snapshot is built.
+
+pricing_rules.txt has one rule per line, and rules stack in file order:
+
+    # selectors: actions
+    fuel=EV: dent_paint -= 500, floor 0
+    brand=BMW: periodic_service *= 1.05
+    fuel=Diesel, brand=Tata: express_service += 200, cap 5000
+    *: full_body_paint *= 1.1
+
+Selectors match fuel, brand and model the same way /get-price does. Case and
+spacing are ignored, and fuel, brand and model aliases such as "petrol", "VW"
+or "Maruti Suzuki" work. `*` matches
+every car. An action is `<price field> <op> <number>`, where op is `=`, `+=`,
+`-=` or `*=`. `floor N` and `cap N` clamp every price the rule changes.
+Arithmetic leaves #N/A prices missing, while `=` sets them. Prices are
+rounded to whole rupees once, after the last rule.
+
+pricing_data.json and the CSV are never modified. Each rule makes one pass
+over the column of prices it changes, visiting only the rows its selectors
+pick out of a value -> rows index.
+
+Usage: python pricing_rules.py [pricing_rules.txt] [pricing_data.json]   # preview
+"""
+
+import operator
+import os
+import re
+import sys
+
+from pricing_index import PRICE_FIELDS, canonical
+
+RULES_FILE = os.environ.get('PRICING_RULES_FILE', 'pricing_rules.txt')
+SELECTOR_FIELDS = ('fuel', 'brand', 'model')
+
+OPERATORS = {
+    '=': lambda price, value: value,
+    '+=': operator.add,
+    '-=': operator.sub,
+    '*=': operator.mul
+}
+
+CHANGE_PATTERN = re.compile(r'^(\w+)\s*(\+=|-=|\*=|=)\s*(-?\d+(?:\.\d+)?)$')
+BOUND_PATTERN = re.compile(r'^(floor|cap)\s+(-?\d+(?:\.\d+)?)$')
+
+class Rule:
+    """One parsed line of the rules file"""
+
+    def __init__(self, line, text, selectors, changes, floor=None, cap=None):
+        self.line = line
+        self.text = text
+        self.selectors = selectors    # {'fuel': canonical value, ...}
+        self.changes = changes        # [(price field, op, number)]
+        self.floor = floor
+        self.cap = cap
+
+    def clamp(self, price):
+        if self.floor is not None and price < self.floor:
+            return self.floor
+        if self.cap is not None and price > self.cap:
+            return self.cap
+        return price
+
+    def rows(self, positions, fuel_aliases, name_aliases, row_count):
+        """Sorted row numbers of the cars this rule selects"""
+        if not self.selectors:
+            return range(row_count)
+        # Resolved through the same aliases as a /get-price request, so brand=VW finds volkswagen
+        keys = dict(self.selectors)
+        if 'fuel' in keys:
+            keys['fuel'] = fuel_aliases.get(keys['fuel'], keys['fuel'])
+        if 'brand' in keys:
+            keys['brand'] = name_aliases.get(keys['brand'], keys['brand'])
+            if 'model' in keys:
+                keys['model'] = name_aliases.get((keys['brand'], keys['model']), keys['model'])
+        candidates = [positions[field].get(value, ()) for field, value in keys.items()]
+        candidates.sort(key=len)
+        others = [set(rows) for rows in candidates[1:]]
+        return [row for row in candidates[0] if all(row in rows for rows in others)]
+
+def parse_number(text):
+    return float(text) if '.' in text else int(text)
+
+def parse_rule(line, text):
+    """Rule for one non-blank line, or ValueError naming the line"""
+    selector_text, colon, action_text = text.partition(':')
+    if not colon:
+        raise ValueError(f"Rule line {line}: expected '<selectors>: <actions>', got {text!r}")
+
+    selectors = {}
+    if selector_text.strip() != '*':
+        for part in selector_text.split(','):
+            field, equals, value = part.partition('=')
+            field = field.strip().lower()
+            if not equals or field not in SELECTOR_FIELDS or not value.strip():
+                raise ValueError(f"Rule line {line}: bad selector {part.strip()!r}, expected fuel=, brand= or model=")
+            selectors[field] = canonical(value)
+
+    changes = []
+    bounds = {}
+    for part in action_text.split(','):
+        part = part.strip()
+        change = CHANGE_PATTERN.match(part)
+        bound = BOUND_PATTERN.match(part)
+        if change and change.group(1) in PRICE_FIELDS:
+            changes.append((change.group(1), change.group(2), parse_number(change.group(3))))
+        elif bound:
+            bounds[bound.group(1)] = parse_number(bound.group(2))
+        else:
+            raise ValueError(
+                f"Rule line {line}: bad action {part!r}, expected '<price field> <op> <number>' "
+                f"(fields: {', '.join(PRICE_FIELDS)}), 'floor N' or 'cap N'"
+            )
+    if not changes:
+        raise ValueError(f"Rule line {line}: no price changes")
+
+    return Rule(line, text, selectors, changes, bounds.get('floor'), bounds.get('cap'))
+
+def load_rules(path=RULES_FILE):
+    """Parsed rules in file order; no file means no rules"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+
+    rules = []
+    for line, text in enumerate(lines, start=1):
+        text = text.split('#', 1)[0].strip()
+        if text:
+            rules.append(parse_rule(line, text))
+    return rules
+
+def apply_rules(index, rules, fuel_aliases, name_aliases=None):
+    """
+    Apply the rules in order to the records of a freshly loaded index, in place.
+
+    Returns (keys whose prices changed, [(rule, cars matched)]).
+    """
+    if not rules:
+        return [], []
+    keys = list(index)
+    records = [index[key] for key in keys]
+
+    # Key fuel/brand/model value -> row numbers, so a rule only visits the cars it names
+    positions = {field: {} for field in SELECTOR_FIELDS}
+    for row, key in enumerate(keys):
+        for field, value in zip(SELECTOR_FIELDS, key):
+            positions[field].setdefault(value, []).append(row)
+
+    columns = {field: [record[field] for record in records] for field in PRICE_FIELDS}
+    touched = set()
+    matched = []
+    for rule in rules:
+        rows = rule.rows(positions, fuel_aliases, name_aliases or {}, len(keys))
+        for field, op, value in rule.changes:
+            column = columns[field]
+            apply = OPERATORS[op]
+            for row in rows:
+                price = column[row]
+                if price is not None or op == '=':
+                    column[row] = rule.clamp(apply(price, value))
+        touched.update(rows)
+        matched.append((rule, len(rows)))
+
+    changed = []
+    for row in sorted(touched):
+        record = records[row]
+        prices = {field: None if columns[field][row] is None else int(round(columns[field][row])) for field in PRICE_FIELDS}
+        if any(record[field] != price for field, price in prices.items()):
+            record.update(prices)
+            changed.append(keys[row])
+    return changed, matched
+
+if __name__ == '__main__':
+    import json
+    from pricing_index import build_fuel_aliases, build_index, build_name_aliases
+
+    rules_file = sys.argv[1] if len(sys.argv) > 1 else RULES_FILE
+    data_file = sys.argv[2] if len(sys.argv) > 2 else 'pricing_data.json'
+
+    with open(data_file, 'r') as f:
+        loaded = json.load(f)
+    index = build_index(loaded['data'])
+    before = {key: dict(record) for key, record in index.items()}
+
+    changed, matched = apply_rules(
+        index, load_rules(rules_file), build_fuel_aliases(loaded['data']), build_name_aliases(index)
+    )
+    for rule, count in matched:
+        print(f"📐 Line {rule.line}: {rule.text}  ({count} cars)")
+    for key in changed[:20]:
+        diff = ', '.join(
+            f"{field} {before[key][field]} -> {index[key][field]}"
+            for field in PRICE_FIELDS if before[key][field] != index[key][field]
+        )
+        print(f"  {' / '.join(key)}: {diff}")
+    if len(changed) > 20:
+        print(f"  ... and {len(changed) - 20} more")
+    print(f"✅ {len(changed)} cars would change; {data_file} was not modified")
@@ -0,0 +1,454 @@
+"""
+Pricing data loading and lookups shared by the Flask (app_optimized.py) and
+ASGI (app_asgi.py) apps, so both servers give identical answers.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+
+from pricing_backends import BACKENDS, create_backend
+from pricing_compiler import CSV_FILE, DATA_FILE, compile_pricing
+from pricing_rules import RULES_FILE, apply_rules, load_rules
+from pricing_index import (
+    build_fuel_aliases, build_index, build_name_aliases, build_response_cache, canonical, compress_variants,
+    dump_json, entity_tag, fuel_key, iter_catalog_lines, make_key, normalize, render_catalog_body
+)
+from search_index import CatalogAutocomplete, CatalogSuggester
+
+RELOAD_CHECK_INTERVAL = float(os.environ.get('RELOAD_CHECK_INTERVAL', 5))
+PRICING_BACKEND = os.environ.get('PRICING_BACKEND', 'index')
+# 'lazy': the boot snapshot builds its deferrable parts on first use; 'boot': all up front
+PRICING_WARM = os.environ.get('PRICING_WARM', 'lazy')
+
+def create_optimized_data(data_file=DATA_FILE):
+    """Compile the CSV into pricing_data.json (see pricing_compiler.py)"""
+    try:
+        result, report = compile_pricing(CSV_FILE, data_file)
+        report.print_summary()
+        if result is None:
+            return None
+        
+        print(f"✅ Optimized data created: {result['total_records']} records")
+        return result
+        
+    except Exception as e:
+        print(f"❌ Error creating optimized data: {e}")
+        return None
+
+def file_signature(path):
+    """(mtime, inode, size) of the data file - changes whenever a script rewrites or replaces it"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+def data_signature(data_file=DATA_FILE, rules_file=RULES_FILE):
+    return (file_signature(data_file), file_signature(rules_file))
+
+class SnapshotParts(dict):
+    """
+    The contents of a pricing snapshot, some of which may still be builders.
+    
+    Parts that only some requests need (the lookup backend, which may import pandas,
+    suggestions, autocomplete and the compressed catalogs) are built on first lookup,
+    once, under a lock. Built parts are plain dict entries, so behind the snapshot's
+    MappingProxyType they cost a C dict lookup like everything else; only a missing
+    key reaches __missing__.
+    """
+    
+    def __init__(self, built, builders):
+        super().__init__(built)
+        self.builders = builders
+        self.build_lock = threading.Lock()
+    
+    def __missing__(self, key):
+        if key not in self.builders:
+            raise KeyError(key)
+        with self.build_lock:
+            if key not in self:
+                started = time.perf_counter()
+                self[key] = self.builders[key](self)
+                print(f"⏳ Built {key} on first use in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return dict.__getitem__(self, key)
+    
+    def warm(self):
+        """Build every deferred part now; returns the seconds it took"""
+        started = time.perf_counter()
+        with self.build_lock:
+            for key, builder in self.builders.items():
+                if key not in self:
+                    self[key] = builder(self)
+        return time.perf_counter() - started
+
+def build_export(snapshot):
+    """The unfiltered export, compressed; the identity version is still streamed from the tree"""
+    export = compress_variants(b''.join(iter_catalog_lines(snapshot['data'])))
+    del export['identity']
+    return export
+
+def build_model_responses(snapshot):
+    """Brands as the catalog and as lowercase spell them cover nearly every /get-models call"""
+    return {
+        spelling: compress_variants(models_body(spelling, snapshot['model_lists'][canonical(brand)]))
+        for brand in snapshot['brands']
+        for spelling in (brand, brand.lower())
+    }
+
+def build_fuel_brand_responses(snapshot):
+    """/get-brands-for-fuel bodies, one per fuel key"""
+    facets = snapshot['facets']
+    return {
+        fuel: render_catalog_body({"success": True, "fuel_type": name, "brands": facets['fuel_brands'].get(fuel, [])})
+        for fuel, name in facets['fuel_names'].items()
+    }
+
+def load_pricing_data(data_file=DATA_FILE, backend=PRICING_BACKEND, rules_file=RULES_FILE, warm=True,
+                      skip_bad_rules=False):
+    """
+    Load pricing data (creating it from the CSV if missing), apply the price rules and build every lookup structure.
+    
+    With warm=False the deferrable parts are built on first use (see SnapshotParts) and
+    listed in 'deferred'. 'phases' holds the seconds spent loading, indexing and warming.
+    A rules file that fails to parse raises ValueError, or with skip_bad_rules=True is
+    logged and the sheet's own prices are served.
+    """
+    started = time.perf_counter()
+    signature = data_signature(data_file, rules_file)
+    try:
+        rules = load_rules(rules_file)
+    except ValueError as e:
+        if not skip_bad_rules:
+            raise
+        print(f"❌ {e} - serving sheet prices without rules until {rules_file} is fixed")
+        rules = []
+    
+    # Try to load existing optimized data, create if doesn't exist
+    try:
+        with open(data_file, 'r') as f:
+            loaded = json.load(f)
+        
+        # Calculate stats from the new structure
+        total_records = sum(
+            sum(len(models) for models in brands.values()) 
+            for brands in loaded['data'].values()
+        )
+        
+        # Extract unique brands and fuel types
+        brands = set()
+        fuel_types = list(loaded['data'].keys())
+        
+        for fuel_data in loaded['data'].values():
+            for brand_data in fuel_data.values():
+                for model_data in brand_data.values():
+                    brands.add(model_data['original_brand'])
+        
+        # Add metadata to pricing_data for compatibility
+        loaded['total_records'] = total_records
+        loaded['brands'] = sorted(list(brands))
+        loaded['fuel_types'] = fuel_types
+        
+        print(f"✅ Loaded optimized data: {total_records} records, {len(brands)} brands, {len(fuel_types)} fuel types")
+        
+    except FileNotFoundError:
+        print("📦 Creating optimized data structure...")
+        loaded = create_optimized_data(data_file)
+        signature = data_signature(data_file, rules_file)
+    
+    if not loaded:
+        return None
+    
+    indexed = time.perf_counter()
+    
+    loaded['index'] = build_index(loaded['data'])
+    loaded['fuel_aliases'] = build_fuel_aliases(loaded['fuel_types'])
+    loaded['name_aliases'] = build_name_aliases(loaded['index'])
+    
+    # Rules change the records in place, so everything built below already sees the new prices
+    changed, _ = apply_rules(loaded['index'], rules, loaded['fuel_aliases'], loaded['name_aliases'])
+    if rules:
+        print(f"📐 Applied {len(rules)} price rules: {len(changed)} cars changed")
+    
+    # One ready-made body per car; under gunicorn's preload_app every worker shares them copy-on-write
+    loaded['responses'] = build_response_cache(loaded['index'])
+    loaded['source'] = signature
+    
+    # Content hash of the whole catalog: identical data gives the same version in every worker
+    loaded['version'] = hashlib.blake2b(dump_json(loaded['data']), digest_size=8).hexdigest()
+    
+    # Catalog bodies only change with the data, so they are rendered (and tagged) once per load
+    loaded['catalog'] = {
+        'brands': render_catalog_body({"success": True, "brands": loaded['brands']}),
+        'fuel_types': render_catalog_body({"success": True, "fuel_types": loaded['fuel_types']})
+    }
+    loaded['facets'] = build_facets(loaded['index'], loaded['fuel_types'])
+    loaded['model_lists'] = {
+        brand: json.dumps(models, separators=(',', ':')).encode('utf-8')
+        for brand, models in loaded['facets']['brand_models'].items()
+    }
+    index = loaded['index']
+    
+    snapshot = SnapshotParts(loaded, {
+        'backend': lambda snapshot: create_backend(backend, snapshot),
+        'suggester': lambda snapshot: CatalogSuggester(
+            (record['original_brand'], record['original_model'])
+            for record in index.values()
+        ),
+        'autocomplete': lambda snapshot: CatalogAutocomplete(
+            (fuel_key, brand_key, record['original_brand'], record['original_model'])
+            for (fuel_key, brand_key, model_key), record in index.items()
+        ),
+        'model_responses': build_model_responses,
+        'fuel_brand_responses': build_fuel_brand_responses,
+        'export': build_export
+    })
+    warmed = time.perf_counter()
+    snapshot['phases'] = {
+        'snapshot_load': indexed - started,
+        'index_build': warmed - indexed,
+        'cache_warm': snapshot.warm() if warm else 0.0
+    }
+    snapshot['deferred'] = () if warm else tuple(snapshot.builders)
+    snapshot['load_seconds'] = time.perf_counter() - started
+    snapshot['loaded_at'] = time.time()
+    print(f"✅ Pre-rendered {len(loaded['responses'])} price responses")
+    
+    # Read-only from here on: a snapshot is never modified, only replaced
+    return MappingProxyType(snapshot)
+
+def request_field(item, name):
+    """A request field as a stripped string; a number (CarModel 800) is spelled out, anything else is missing"""
+    value = item.get(name)
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return ''
+
+def price_key(data, item):
+    """The canonical (fuel, brand, model) key resolve_price() looks up for a request"""
+    return make_key(
+        data['fuel_aliases'],
+        request_field(item, 'FuelType'),
+        request_field(item, 'CarManufacturer'),
+        request_field(item, 'CarModel'),
+        data['name_aliases']
+    )
+
+def resolve_price(data, item):
+    """Validate one price request and look it up: (200, cached body) or (status, error dict)"""
+    car_manufacturer = request_field(item, 'CarManufacturer')
+    car_model = request_field(item, 'CarModel')
+    fuel_type = request_field(item, 'FuelType')
+    
+    if not all([car_manufacturer, car_model, fuel_type]):
+        return 400, {
+            "error": "Missing required parameters",
+            "message": "Please provide CarManufacturer, CarModel, and FuelType",
+            "received": {
+                "CarManufacturer": car_manufacturer,
+                "CarModel": car_model,
+                "FuelType": fuel_type
+            }
+        }
+    
+    if not data:
+        return 500, {
+            "error": "Data not available",
+            "message": "Pricing data could not be loaded"
+        }
+    
+    # The canonical (fuel, brand, model) key; the index backend makes this one hash probe
+    key = make_key(data['fuel_aliases'], fuel_type, car_manufacturer, car_model, data['name_aliases'])
+    cached = data['backend'].response(key)
+    
+    if cached:
+        return 200, cached
+    
+    # Closest brands/models by bigram similarity and edit distance
+    suggestions = data['suggester'].suggest(car_manufacturer, car_model)
+    
+    return 404, {
+        "error": "No matching record found",
+        "message": f"No pricing data found for {fuel_type} {car_manufacturer} {car_model}",
+        "suggestions": suggestions
+    }
+
+def build_facets(index, fuel_types):
+    """
+    Catalog facets, built once per snapshot so every step of a guided menu is one dict lookup.
+    
+    Keys are index keys (normalized fuel, canonical brand and model); values are display
+    names, fuel types in catalog order and everything else sorted:
+      brand_models       brand -> models, any fuel
+      brand_fuels        brand -> fuel types
+      fuel_brands        fuel -> brands
+      fuel_brand_models  (fuel, brand) -> models
+      model_fuels        (brand, model) -> fuel types
+      fuel_names         fuel -> display name
+    """
+    facets = {name: {} for name in ('brand_models', 'brand_fuels', 'fuel_brands', 'fuel_brand_models', 'model_fuels')}
+    for (fuel, brand, model), record in index.items():
+        facets['brand_models'].setdefault(brand, set()).add(record['original_model'])
+        facets['brand_fuels'].setdefault(brand, set()).add(record['original_fuel'])
+        facets['fuel_brands'].setdefault(fuel, set()).add(record['original_brand'])
+        facets['fuel_brand_models'].setdefault((fuel, brand), set()).add(record['original_model'])
+        facets['model_fuels'].setdefault((brand, model), set()).add(record['original_fuel'])
+    
+    order = {fuel: position for position, fuel in enumerate(fuel_types)}
+    
+    def fuel_order(fuel):
+        return order.get(fuel, len(order)), fuel
+    
+    for name, facet in facets.items():
+        sort_key = fuel_order if name in ('brand_fuels', 'model_fuels') else None
+        for key, values in facet.items():
+            facet[key] = sorted(values, key=sort_key)
+    facets['fuel_names'] = {normalize(fuel): fuel for fuel in fuel_types}
+    return facets
+
+def brand_key(data, brand):
+    """The catalog's brand key for any accepted spelling of a brand"""
+    key = canonical(brand)
+    return data['name_aliases'].get(key, key)
+
+def catalog_scope(data, fuel_type, brand):
+    """(fuel key, brand key) filters for a catalog request, None for a field not given; an unknown fuel matches nothing"""
+    fuel = fuel_key(data['fuel_aliases'], fuel_type) or normalize(fuel_type) if fuel_type else None
+    return fuel, brand_key(data, brand) if brand else None
+
+def identity_body(obj):
+    """A per-request catalog answer; small enough to send uncompressed"""
+    body = dump_json(obj)
+    return {'identity': (body, str(len(body)), entity_tag(body))}
+
+def models_body(brand, models):
+    return b'{"brand":%s,"models":%s,"success":true}\n' % (json.dumps(brand).encode('utf-8'), models)
+
+def render_models_body(data, brand, fuel_type=None):
+    """Encodings of the /get-models answer for a brand as the caller spelled it, optionally for one fuel"""
+    if fuel_type:
+        fuel = fuel_key(data['fuel_aliases'], fuel_type)
+        return identity_body({
+            "success": True,
+            "brand": brand,
+            "fuel_type": data['facets']['fuel_names'].get(fuel, fuel_type),
+            "models": data['facets']['fuel_brand_models'].get((fuel, brand_key(data, brand)), [])
+        })
+    
+    cached = data['model_responses'].get(brand)
+    if cached:
+        return cached
+    
+    # Unusual spellings (and unknown brands) are small enough to send uncompressed
+    body = models_body(brand, data['model_lists'].get(brand_key(data, brand), b'[]'))
+    return {'identity': (body, str(len(body)), entity_tag(body))}
+
+def render_fuel_types_body(data, brand=None, model=None):
+    """Encodings of the /get-fuel-types answer: every fuel type, or those of a brand or model"""
+    if not brand:
+        return data['catalog']['fuel_types']
+    
+    key = brand_key(data, brand)
+    answer = {"success": True, "brand": brand}
+    if model:
+        model_key = canonical(model)
+        model_key = data['name_aliases'].get((key, model_key), model_key)
+        answer["model"] = model
+        answer["fuel_types"] = data['facets']['model_fuels'].get((key, model_key), [])
+    else:
+        answer["fuel_types"] = data['facets']['brand_fuels'].get(key, [])
+    return identity_body(answer)
+
+def render_fuel_brands_body(data, fuel_type):
+    """Encodings of the /get-brands-for-fuel answer for any accepted spelling of a fuel"""
+    cached = data['fuel_brand_responses'].get(fuel_key(data['fuel_aliases'], fuel_type))
+    if cached:
+        return cached
+    return identity_body({"success": True, "fuel_type": fuel_type, "brands": []})
+
+class PricingStore:
+    """
+    Holds the current pricing snapshot and replaces it when the data files change.
+    
+    Every worker notices a rewritten pricing_data.json or rules file on its own (a cheap
+    stat() at most every `check_interval` seconds, from maybe_reload() on the
+    request path), builds the new snapshot in a background thread and swaps
+    `data` in one assignment. Requests already running keep the snapshot they
+    started with, and the lookup path never takes a lock.
+    """
+    
+    def __init__(self, data_file=DATA_FILE, check_interval=RELOAD_CHECK_INTERVAL, backend=PRICING_BACKEND,
+                 rules_file=RULES_FILE, warm=PRICING_WARM == 'boot'):
+        self.data_file = data_file
+        self.rules_file = rules_file
+        self.check_interval = check_interval
+        self.backend = backend
+        self.reload_lock = threading.Lock()
+        self.next_check = 0.0
+        self.failed_signature = None
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown pricing backend {backend!r}, expected one of: {', '.join(BACKENDS)}")
+        
+        # An empty data file at boot (e.g. an interrupted copy) is rebuilt from the CSV
+        if os.path.exists(data_file) and os.path.getsize(data_file) == 0:
+            print(f"⚠️ {data_file} is empty, recompiling it")
+            create_optimized_data(data_file)
+        
+        # A corrupt data file must not stop the worker from booting: serve "Data not
+        # available" and pick the file up as soon as a fixed one is written. There are no
+        # last good prices yet, so a broken rules file only costs the rules.
+        try:
+            self.data = load_pricing_data(data_file, backend, rules_file, warm, skip_bad_rules=True)
+        except Exception as e:
+            print(f"❌ Could not load {data_file}: {e}")
+            self.data = None
+            self.failed_signature = data_signature(data_file, rules_file)
+    
+    def reload(self):
+        """Build a fresh snapshot off the request path and swap it in atomically"""
+        if not self.reload_lock.acquire(blocking=False):
+            return False
+        try:
+            signature = data_signature(self.data_file, self.rules_file)
+            started = time.perf_counter()
+            # Built in full: this thread is off the request path, the first lookups after the swap are not
+            snapshot = load_pricing_data(self.data_file, self.backend, self.rules_file)
+            if snapshot:
+                self.data = snapshot
+                print(f"🔄 Reloaded pricing data in {(time.perf_counter() - started) * 1000:.0f}ms")
+            else:
+                self.failed_signature = signature
+            return bool(snapshot)
+        except Exception as e:
+            # A half-written or broken file must never take down a serving worker
+            self.failed_signature = signature
+            print(f"❌ Reload failed, keeping current data: {e}")
+            return False
+        finally:
+            self.reload_lock.release()
+    
+    def start_reload(self):
+        """Kick off a background reload unless one is already running"""
+        if self.reload_lock.locked():
+            return False
+        threading.Thread(target=self.reload, daemon=True).start()
+        return True
+    
+    def maybe_reload(self):
+        """Start a reload if the data files changed since the current snapshot was built"""
+        if self.check_interval <= 0:
+            return
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + self.check_interval
+        
+        signature = data_signature(self.data_file, self.rules_file)
+        current = self.data['source'] if self.data else None
+        if signature[0] and signature != current and signature != self.failed_signature:
+            self.start_reload()
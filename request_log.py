@@ -0,0 +1,253 @@
+"""
+JSONL audit log of /get-price calls, written off the request path.
+
+A request only appends a tuple to a bounded in-memory queue (put_nowait: no
+lock held across I/O, no file access). One background thread per process
+drains the queue, formats the entries and appends them in batches of up to
+`batch_size` or every `flush_interval` seconds, with a single write() per
+batch. When the queue is full the entry is dropped and counted instead of
+blocking the webhook.
+
+Logging is off unless REQUEST_LOG_DIR names a directory. Files are named by
+time bucket, e.g. request_logs/get-price-20261017.jsonl. A new bucket
+(REQUEST_LOG_ROTATE: hourly or daily) starts a new file. A file that reaches
+`max_bytes` continues in get-price-20261017.1.jsonl and so on. Every worker
+derives the same names, so workers share the files without renaming anything
+or coordinating. A batch is one O_APPEND write, so lines from different
+workers never interleave. Whenever a worker opens a new file it deletes the
+oldest ones beyond REQUEST_LOG_MAX_FILES, so the directory can't fill the disk.
+
+Each line carries the inputs as sent (replayable with loadtest.py --replay),
+the canonical key, the matched key, status, outcome, latency and the
+snapshot version the price came from.
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import weakref
+
+from metrics import PRICE_OUTCOMES
+from pricing_index import canonical, make_key
+
+REQUEST_LOG_DIR = os.environ.get('REQUEST_LOG_DIR', '')
+REQUEST_LOG_QUEUE = int(os.environ.get('REQUEST_LOG_QUEUE', 10000))
+REQUEST_LOG_MAX_BYTES = int(os.environ.get('REQUEST_LOG_MAX_BYTES', 64 * 1024 * 1024))
+REQUEST_LOG_ROTATE = os.environ.get('REQUEST_LOG_ROTATE', 'daily')
+REQUEST_LOG_MAX_FILES = int(os.environ.get('REQUEST_LOG_MAX_FILES', 30))
+
+ROTATE_FORMATS = {'hourly': '%Y%m%d-%H', 'daily': '%Y%m%d'}
+INPUT_FIELDS = ('FuelType', 'CarManufacturer', 'CarModel')
+
+def format_entry(entry):
+    """One JSONL line for a queued (time, item, status, snapshot, seconds) tuple"""
+    logged_at, item, status, snapshot, seconds = entry
+    if not isinstance(item, dict):
+        item = {}
+    inputs = {field: str(item.get(field, '')).strip() for field in INPUT_FIELDS}
+
+    normalized = matched = None
+    if all(inputs.values()):
+        if snapshot:
+            key = make_key(
+                snapshot['fuel_aliases'], inputs['FuelType'], inputs['CarManufacturer'], inputs['CarModel'],
+                snapshot['name_aliases']
+            )
+        else:
+            key = tuple(canonical(inputs[field]) for field in INPUT_FIELDS)
+        normalized = list(key)
+        matched = normalized if status == 200 else None
+
+    line = {
+        'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(logged_at)) + f'.{int(logged_at % 1 * 1000):03d}Z',
+        **inputs,
+        'normalized': normalized,
+        'matched': matched,
+        'status': status,
+        'outcome': PRICE_OUTCOMES.get(status, 'error'),
+        'latency_ms': round(seconds * 1000, 3),
+        'data_version': snapshot['version'] if snapshot else None
+    }
+    return json.dumps(line, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b'\n'
+
+class RequestLog:
+    """Bounded queue in front of a batching, rotating JSONL writer thread"""
+
+    def __init__(self, directory=REQUEST_LOG_DIR, queue_size=REQUEST_LOG_QUEUE, batch_size=500,
+                 flush_interval=1.0, max_bytes=REQUEST_LOG_MAX_BYTES, rotate=REQUEST_LOG_ROTATE, name='get-price',
+                 max_files=REQUEST_LOG_MAX_FILES):
+        if rotate not in ROTATE_FORMATS:
+            raise ValueError(f"Unknown REQUEST_LOG_ROTATE {rotate!r}, expected one of: {', '.join(ROTATE_FORMATS)}")
+        self.directory = directory
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.stamp_format = ROTATE_FORMATS[rotate]
+        self.name = name
+        self.max_files = max_files
+        self.reset()
+        REQUEST_LOGS.add(self)
+
+    def reset(self):
+        self.queue = queue.Queue(self.queue_size)
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.drop_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.fd = None
+        self.stamp = None
+        self.part = 0
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def record(self, item, status, snapshot, seconds):
+        """Queue one /get-price call; never blocks and never touches the disk"""
+        if not self.enabled:
+            return
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait((time.time(), item, status, snapshot, seconds))
+        except queue.Full:
+            with self.drop_lock:
+                self.dropped += 1
+
+    def start(self):
+        with self.start_lock:
+            if self.thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.thread = threading.Thread(target=self.run, name='request-log-writer', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self.write(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def path_for(self, stamp, part):
+        suffix = f'.{part}' if part else ''
+        return os.path.join(self.directory, f'{self.name}-{stamp}{suffix}.jsonl')
+
+    def current_fd(self):
+        """Append descriptor for the current time bucket, moving past files that are full"""
+        stamp = time.strftime(self.stamp_format, time.gmtime())
+        if stamp != self.stamp:
+            self.close_fd()
+            self.stamp, self.part = stamp, 0
+        while True:
+            if self.fd is None:
+                path = self.path_for(self.stamp, self.part)
+                self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self.prune(path)
+            if os.fstat(self.fd).st_size < self.max_bytes:
+                return self.fd
+            self.close_fd()
+            self.part += 1
+
+    def prune(self, current):
+        """Delete the least recently written files beyond max_files, never `current` (0 keeps them all)"""
+        if not self.max_files:
+            return
+        prefix = self.name + '-'
+        others = [
+            path for path in (os.path.join(self.directory, name) for name in os.listdir(self.directory))
+            if os.path.basename(path).startswith(prefix) and path.endswith('.jsonl') and path != current
+        ]
+        excess = len(others) - (self.max_files - 1)
+        if excess <= 0:
+            return
+
+        def modified(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0.0
+
+        # Other workers prune the same directory; a file they already removed is fine
+        for path in sorted(others, key=modified)[:excess]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def close_fd(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def write(self, batch):
+        try:
+            data = b''.join(format_entry(entry) for entry in batch)
+            with self.write_lock:
+                fd = self.current_fd()
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            self.written += len(batch)
+        except Exception as e:
+            # Losing log lines must never take the writer (or a request) down
+            with self.drop_lock:
+                self.dropped += len(batch)
+            print(f"❌ Request log write failed, {len(batch)} entries dropped: {e}")
+
+    def flush(self):
+        """Wait until everything queued so far is on disk"""
+        if self.thread is not None:
+            self.queue.join()
+
+    def close(self):
+        """Write out whatever is still queued (at exit, from the calling thread)"""
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.write(batch)
+            for _ in batch:
+                self.queue.task_done()
+        with self.write_lock:
+            self.close_fd()
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'queued': self.queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped
+        }
+
+# Fork and exit hooks are registered once for every log, not once per instance
+REQUEST_LOGS = weakref.WeakSet()
+
+def reset_request_logs():
+    # The writer thread doesn't survive a fork; each worker starts its own on first use
+    for log in list(REQUEST_LOGS):
+        log.reset()
+
+def close_request_logs():
+    for log in list(REQUEST_LOGS):
+        log.close()
+
+os.register_at_fork(after_in_child=reset_request_logs)
+atexit.register(close_request_logs)
@@ -0,0 +1,61 @@
+"""
+Boot-time breakdown of an entry point, so cold starts can be held to a budget.
+
+On scale-to-zero hosts the first request waits for the whole boot. An app
+module notes time.perf_counter() before its first import and marks each
+phase as it ends. The store's phase is split into the snapshot's own phases
+(see load_pricing_data): snapshot_load, index_build and cache_warm. finish()
+prints one line, with a warning when the total exceeds STARTUP_BUDGET_MS, and
+/health serves the same numbers. Interpreter start-up, before the module's
+first line runs, is not included.
+"""
+
+import os
+import time
+
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 1000))
+
+class StartupReport:
+    """Seconds spent in each boot phase of one entry point"""
+
+    def __init__(self, started, budget_ms=STARTUP_BUDGET_MS):
+        self.started = started
+        self.last = started
+        self.budget_ms = budget_ms
+        self.phases = {}
+        self.deferred = ()
+        self.total = None
+
+    def mark(self, phase, parts=None):
+        """End `phase` now; `parts` are sub-phases measured inside it, and the rest keeps its name"""
+        now = time.perf_counter()
+        elapsed = now - self.last
+        for name, seconds in (parts or {}).items():
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            elapsed -= seconds
+        self.phases[phase] = self.phases.get(phase, 0.0) + max(elapsed, 0.0)
+        self.last = now
+
+    def mark_store(self, store):
+        """End the phase that built the pricing store, split into the snapshot's phases"""
+        snapshot = store.data
+        self.mark('store', snapshot['phases'] if snapshot else None)
+        self.deferred = snapshot['deferred'] if snapshot else ()
+
+    def finish(self):
+        """End the last phase (app setup) and log the breakdown"""
+        self.mark('app_setup')
+        self.total = self.last - self.started
+        breakdown = ', '.join(f"{phase} {seconds * 1000:.1f}ms" for phase, seconds in self.phases.items())
+        deferred = f" (on first use: {', '.join(self.deferred)})" if self.deferred else ''
+        print(f"🚀 Started in {self.total * 1000:.0f}ms: {breakdown}{deferred}")
+        if self.budget_ms and self.total * 1000 > self.budget_ms:
+            print(f"⚠️ Startup took {self.total * 1000:.0f}ms, over the {self.budget_ms:.0f}ms budget (STARTUP_BUDGET_MS)")
+
+    def as_dict(self):
+        return {
+            "total_ms": round(self.total * 1000, 1) if self.total is not None else None,
+            "budget_ms": self.budget_ms,
+            "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()},
+            "deferred": list(self.deferred)
+        }
@@ -4,9 +4,16 @@ Test script for optimized GaadiMech Pricing Webhook
 """
 
 import json
+import os
+import pytest
 import requests
 import time
 
+@pytest.fixture(autouse=True, scope='session')
+def metrics_directory(tmp_path_factory):
+    """The apps' per-process metrics files go to a temporary METRICS_DIR, set before any app is imported"""
+    os.environ['METRICS_DIR'] = str(tmp_path_factory.mktemp('metrics'))
+
 def test_json_structure():
     """Test the optimized JSON structure"""
     try:
@@ -45,6 +52,906 @@ def test_json_structure():
         print(f"❌ Error testing JSON: {e}")
         return False
 
+def test_prerendered_responses():
+    """Pre-rendered /get-price bodies must match what jsonify() would send"""
+    from app_optimized import app, store
+    
+    pricing_data = store.data
+    
+    client = app.test_client()
+    record = pricing_data['data']['Petrol/CNG']['maruti']['swift']
+    response = client.post('/get-price', json={
+        "CarManufacturer": "Maruti",
+        "CarModel": "Swift",
+        "FuelType": "petrol/cng"
+    })
+    
+    with app.app_context():
+        expected = app.json.response(json.loads(response.data)).get_data()
+    
+    assert response.status_code == 200
+    assert response.data == expected
+    assert response.headers['Content-Length'] == str(len(expected))
+    assert json.loads(response.data)['data']['service_prices']['periodic_service']['price'] == str(record['periodic_service'])
+    
+    # Anything but a JSON object is the "No data provided" 400, never a 500
+    for body, content_type in (('[1]', 'application/json'), ('"x"', 'application/json'), ('{bad', 'application/json'),
+                               ('Maruti Swift', 'text/plain')):
+        response = client.post('/get-price', data=body, content_type=content_type)
+        assert response.status_code == 400 and response.get_json()['error'] == "No data provided", body
+    print(f"✅ Pre-rendered response matches jsonify ({len(expected)} bytes)")
+
+def test_fuel_aliases():
+    """Old and new fuel spellings must resolve to the same record"""
+    from app_optimized import app
+    
+    client = app.test_client()
+    bodies = set()
+    for fuel in ["petrol", "Petrol/CNG", "PETROL", "cng", "petrol/cng"]:
+        response = client.post('/get-price', json={
+            "CarManufacturer": "maruti",
+            "CarModel": "swift ",
+            "FuelType": fuel
+        })
+        assert response.status_code == 200, fuel
+        bodies.add(response.data)
+    
+    assert len(bodies) == 1
+    print(f"✅ Fuel aliases resolve to one record")
+
+def test_suggestions():
+    """Misspelled lookups should come back with the intended car as a suggestion"""
+    from app_optimized import app
+    
+    client = app.test_client()
+    for brand, model, expected_brand, expected_model in [
+        ("Maruti", "Swfit", "Maruti", "Swift"),
+        ("Hundai", "i 20", "Hyundai", "Elite-I20"),
+        ("Toyota", "inova", "Toyota", "Innova"),
+    ]:
+        response = client.post('/get-price', json={
+            "CarManufacturer": brand,
+            "CarModel": model,
+            "FuelType": "petrol"
+        })
+        suggestions = response.get_json()['suggestions']
+        assert response.status_code == 404
+        assert suggestions['similar_brands'][0] == expected_brand, suggestions
+        assert suggestions['similar_models'][0] == expected_model, suggestions
+    
+    print(f"✅ Suggestions found for misspelled lookups")
+
+def test_autocomplete():
+    """Prefix completions, optionally scoped by brand and fuel type"""
+    from app_optimized import app
+    
+    client = app.test_client()
+    data = client.get('/autocomplete?prefix=sw').get_json()
+    assert data['models'][:2] == [
+        {"brand": "Maruti", "model": "Swift"},
+        {"brand": "Maruti", "model": "Swift Dzire"}
+    ]
+    
+    data = client.get('/autocomplete?prefix=ma').get_json()
+    assert "Maruti" in data['brands'] and "Mahindra" in data['brands']
+    
+    data = client.get('/autocomplete?prefix=dzire&CarManufacturer=maruti&FuelType=petrol').get_json()
+    assert data['brands'] == [] and data['models'] == [{"brand": "Maruti", "model": "Swift Dzire"}]
+    
+    # Brands go through the same aliases as /get-price
+    for brand, expected in (("Maruti Suzuki", "Maruti"), ("VW", "Volkswagen")):
+        data = client.get(f'/autocomplete?prefix=&CarManufacturer={brand}').get_json()
+        assert data['models'] and all(m['brand'] == expected for m in data['models']), brand
+    
+    assert client.get('/autocomplete').status_code == 400
+    print(f"✅ Autocomplete working")
+
+def test_batch_prices():
+    """Batch lookups return one result per item, in order, matching /get-price"""
+    from app_optimized import app
+    
+    client = app.test_client()
+    items = [
+        {"CarManufacturer": "Maruti", "CarModel": "Swift", "FuelType": "petrol"},
+        {"CarManufacturer": "Maruti", "CarModel": "Swfit", "FuelType": "petrol"},
+        {"CarManufacturer": "Maruti"},
+        "not an object",
+        {"CarManufacturer": 1, "CarModel": "Swift", "FuelType": None},
+        {"CarManufacturer": "Maruti", "CarModel": 800, "FuelType": "petrol"}
+    ]
+    response = client.post('/get-prices', json=items)
+    results = response.get_json()['results']
+    
+    assert response.status_code == 200
+    assert len(results) == len(items)
+    assert results[0] == client.post('/get-price', json=items[0]).get_json()
+    assert results[1]['status'] == 404 and results[1]['suggestions']['similar_models'] == ["Swift"]
+    assert results[2]['status'] == 400
+    assert results[3]['status'] == 400
+    # Fields that aren't strings are missing, not a 500; a numeric model name is spelled out
+    assert results[4]['status'] == 400 and results[4]['error'] == "Missing required parameters"
+    assert client.post('/get-price', json=items[4]).status_code == 400
+    assert results[5] == client.post('/get-price', json={**items[5], "CarModel": "800"}).get_json()
+    assert client.post('/get-prices', json=[]).status_code == 400
+    print(f"✅ Batch pricing returned {len(results)} results")
+
+def test_export():
+    """NDJSON export streams every record, optionally filtered"""
+    from app_optimized import app, store
+    
+    pricing_data = store.data
+    
+    client = app.test_client()
+    lines = client.get('/export').data.decode('utf-8').splitlines()
+    assert len(lines) == pricing_data['total_records']
+    
+    lines = client.get('/export?FuelType=petrol&CarManufacturer=maruti').data.decode('utf-8').splitlines()
+    records = [json.loads(line) for line in lines]
+    assert records and all(r['brand'] == "Maruti" and r['fuel_type'] == "Petrol/CNG" for r in records)
+    
+    for brand, expected in (("Maruti Suzuki", "Maruti"), ("VW", "Volkswagen"), ("mercedes benz", "Mercedes")):
+        lines = client.get(f'/export?CarManufacturer={brand}').data.decode('utf-8').splitlines()
+        assert lines and all(json.loads(line)['brand'] == expected for line in lines), brand
+    assert client.get('/export?FuelType=hydrogen').data == b''
+    print(f"✅ Export streamed {len(records)} Maruti petrol records")
+
+def test_hot_reload(tmp_path):
+    """A rewritten data file is picked up and swapped in without a restart"""
+    import app_optimized
+    from pricing_store import PricingStore
+    
+    client = app_optimized.app.test_client()
+    payload = {"CarManufacturer": "Maruti", "CarModel": "Swift", "FuelType": "petrol"}
+    old_price = client.post('/get-price', json=payload).get_json()['data']['service_prices']['periodic_service']['price']
+    
+    with open('pricing_data.json', 'r') as f:
+        data = json.load(f)
+    data['data']['Petrol/CNG']['maruti']['swift']['periodic_service'] = 1234
+    data_file = tmp_path / 'pricing_data.json'
+    data_file.write_text(json.dumps(data))
+    
+    original_store = app_optimized.store
+    try:
+        app_optimized.store = PricingStore(data_file=str(data_file))
+        price = client.post('/get-price', json=payload).get_json()['data']['service_prices']['periodic_service']['price']
+        assert old_price != "1234" and price == "1234"
+        
+        data['data']['Petrol/CNG']['maruti']['swift']['periodic_service'] = 4321
+        data_file.write_text(json.dumps(data))
+        old_snapshot = app_optimized.store.data
+        assert app_optimized.store.reload()
+        new_price = client.post('/get-price', json=payload).get_json()['data']['service_prices']['periodic_service']['price']
+        assert new_price == "4321"
+        assert old_snapshot['index'] is not app_optimized.store.data['index']
+        
+        # A broken rewrite keeps the last good snapshot
+        data_file.write_text('')
+        assert not app_optimized.store.reload()
+        assert client.post('/get-price', json=payload).status_code == 200
+    finally:
+        app_optimized.store = original_store
+    
+    print(f"✅ Hot reload swapped {old_price} -> {new_price}")
+
+def call_asgi(app, method, path, payload=None, headers=()):
+    """Run one request through an ASGI app in-process: (status, headers, body)"""
+    import asyncio
+    
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query.encode('ascii'),
+        'headers': [(b'content-type', b'application/json'), *headers]
+    }
+    messages = []
+    
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    
+    async def send(message):
+        messages.append(message)
+    
+    asyncio.run(app(scope, receive, send))
+    return messages[0]['status'], dict(messages[0]['headers']), messages[1]['body']
+
+def test_asgi_matches_flask():
+    """The ASGI app answers every route byte-for-byte like the Flask app"""
+    from app_optimized import app as flask_app
+    from app_asgi import app as asgi_app
+    
+    client = flask_app.test_client()
+    cases = [
+        ('GET', '/health', None),
+        ('GET', '/get-brands', None),
+        ('GET', '/get-fuel-types', None),
+        ('POST', '/get-models', {"CarManufacturer": "Maruti"}),
+        ('POST', '/get-models', {"CarManufacturer": ""}),
+        ('GET', '/get-models?CarManufacturer=Hyundai', None),
+        ('GET', '/get-models?CarManufacturer=Hyundai&FuelType=diesel', None),
+        ('GET', '/get-fuel-types?CarManufacturer=Maruti&CarModel=Swift', None),
+        ('GET', '/get-brands-for-fuel?FuelType=electric', None),
+        ('POST', '/get-brands-for-fuel', {"FuelType": ""}),
+        ('POST', '/get-models', [{"CarManufacturer": "Maruti"}]),
+        ('POST', '/get-models', None),
+        ('POST', '/get-brands-for-fuel', "electric"),
+        ('POST', '/get-price', ["Maruti", "Swift", "petrol"]),
+        ('POST', '/get-price', "Maruti Swift"),
+        ('POST', '/get-price', {"CarManufacturer": "Maruti", "CarModel": "Swift", "FuelType": "petrol"}),
+        ('POST', '/get-price', {"CarManufacturer": "Maruti", "CarModel": "Swfit", "FuelType": "cng"}),
+        ('POST', '/get-price', {"CarManufacturer": "Maruti"}),
+        ('POST', '/get-price', {}),
+    ]
+    for method, path, payload in cases:
+        expected = client.open(path, method=method, json=payload)
+        status, headers, body = call_asgi(asgi_app, method, path, payload)
+        assert status == expected.status_code, (path, payload)
+        if method == 'POST' and not isinstance(payload, dict):
+            assert status == 400, (path, payload)
+        if path == '/health':
+            # Boot timings are each app's own
+            assert {**json.loads(body), 'startup': None} == {**expected.get_json(), 'startup': None}
+        else:
+            assert body == expected.data, (path, payload)
+        assert headers[b'access-control-allow-origin'] == b'*'
+        assert headers.get(b'etag', b'').decode() == expected.headers.get('ETag', '')
+    
+    print(f"✅ ASGI app matches Flask on {len(cases)} requests")
+
+def test_conditional_catalog():
+    """Catalog endpoints send strong ETags and answer a matching If-None-Match with 304"""
+    from app_optimized import app, store
+    from app_asgi import app as asgi_app
+    
+    client = app.test_client()
+    for path in ['/get-brands', '/get-fuel-types', '/get-models?CarManufacturer=Maruti']:
+        response = client.get(path)
+        etag = response.headers['ETag']
+        assert response.status_code == 200
+        assert etag.startswith('"') and 'max-age' in response.headers['Cache-Control']
+        
+        cached = client.get(path, headers={'If-None-Match': f'"other", W/{etag}'})
+        assert cached.status_code == 304 and cached.data == b''
+        assert cached.headers['ETag'] == etag
+        assert client.get(path, headers={'If-None-Match': '"other"'}).status_code == 200
+        
+        status, headers, body = call_asgi(asgi_app, 'GET', path, headers=[(b'if-none-match', etag.encode())])
+        assert status == 304 and body == b''
+    
+    # Same brand spelled differently is a different body, so a different tag
+    assert client.get('/get-models?CarManufacturer=maruti').headers['ETag'] != etag
+    
+    # The snapshot's content hash is reported for cache debugging
+    assert client.get('/health').get_json()['data_version'] == store.data['version']
+    
+    print("✅ Conditional GET: 304s on matching ETags for brands, fuel types and models")
+
+def test_precompressed_catalog():
+    """Catalog responses are compressed at load time and chosen by Accept-Encoding"""
+    import gzip
+    from app_optimized import app
+    
+    client = app.test_client()
+    for path in ['/get-brands', '/get-models?CarManufacturer=Maruti', '/export']:
+        plain = client.get(path)
+        compressed = client.get(path, headers={'Accept-Encoding': 'gzip, deflate'})
+        assert compressed.headers['Content-Encoding'] == 'gzip'
+        assert compressed.headers['Vary'] == 'Accept-Encoding'
+        assert gzip.decompress(compressed.data) == plain.data
+        assert 'Content-Encoding' not in plain.headers
+        if 'ETag' in plain.headers:
+            assert compressed.headers['ETag'] != plain.headers['ETag']
+    
+    # Refused codings and filtered exports fall back to identity
+    assert 'Content-Encoding' not in client.get('/get-brands', headers={'Accept-Encoding': 'gzip;q=0'}).headers
+    assert 'Content-Encoding' not in client.get('/export?CarManufacturer=Maruti', headers={'Accept-Encoding': 'gzip'}).headers
+    
+    print("✅ Pre-compressed gzip catalog bodies served by Accept-Encoding")
+
+def test_facets():
+    """Guided-menu lists come straight from facet indexes and agree with the price index"""
+    from app_optimized import app, store
+    
+    snapshot = store.data
+    facets = snapshot['facets']
+    index = snapshot['index']
+    for fuel, brand, model in index:
+        assert index[fuel, brand, model]['original_model'] in facets['fuel_brand_models'][fuel, brand]
+        assert facets['fuel_names'][fuel] in facets['model_fuels'][brand, model]
+    assert sum(len(models) for models in facets['fuel_brand_models'].values()) == len(index)
+    assert facets['brand_fuels']['maruti'] == [fuel for fuel in snapshot['fuel_types'] if 'maruti' in snapshot['data'][fuel]]
+    
+    client = app.test_client()
+    models = client.get('/get-models?CarManufacturer=Maruti&FuelType=cng').get_json()
+    assert models['fuel_type'] == 'Petrol/CNG' and models['models'] == facets['fuel_brand_models']['petrol/cng', 'maruti']
+    assert client.post('/get-models', json={"CarManufacturer": "Maruti", "FuelType": "hydrogen"}).get_json()['models'] == []
+    
+    fuels = client.get('/get-fuel-types?CarManufacturer=Hyundai&CarModel=i-20').get_json()
+    assert fuels['fuel_types'] == facets['model_fuels']['hyundai', 'elitei20']
+    
+    # A POST body that isn't a JSON object is the route's own 400
+    for path, body in (('/get-models', [{"CarManufacturer": "Maruti"}]), ('/get-brands-for-fuel', "electric")):
+        assert client.post(path, json=body).status_code == 400, path
+    assert client.post('/get-models', data='Maruti', content_type='text/plain').status_code == 400
+    
+    brands = client.post('/get-brands-for-fuel', json={"FuelType": "Electric"}).get_json()
+    assert brands['fuel_type'] == 'EV' and brands['brands'] == facets['fuel_brands']['ev']
+    response = client.get('/get-brands-for-fuel?FuelType=diesel')
+    assert response.headers['ETag'] and client.get('/get-brands-for-fuel?FuelType=diesel', headers={
+        'If-None-Match': response.headers['ETag']
+    }).status_code == 304
+    assert client.get('/get-brands-for-fuel').status_code == 400
+    
+    print(f"✅ Facets: {len(facets['fuel_brand_models'])} fuel/brand menus, {len(facets['model_fuels'])} models")
+
+def test_metrics(tmp_path):
+    """Counters from every worker process are summed into one Prometheus scrape"""
+    from app_optimized import app, store
+    from metrics import Metrics
+    
+    metrics = Metrics(['/get-price', '/health'], directory=str(tmp_path))
+    metrics.observe_snapshot(store.data)
+    metrics.observe_request('/get-price', 200, 0.00004)
+    metrics.observe_request('/get-price', 404, 0.0003)
+    
+    # A forked worker gets its own file and adds to the same totals while it runs
+    ready_read, ready_write = os.pipe()
+    done_read, done_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        metrics.observe_request('/get-price', 200, 0.00002)
+        metrics.observe_request('/nowhere', 404, 0.001)
+        os.write(ready_write, b'1')
+        os.read(done_read, 1)
+        os._exit(0)
+    os.read(ready_read, 1)
+    
+    text = metrics.render().decode()
+    assert 'pricing_http_requests_total{route="/get-price",status="2xx"} 2' in text
+    assert 'pricing_http_requests_total{route="unmatched",status="4xx"} 1' in text
+    assert 'pricing_price_lookups_total{outcome="hit"} 2' in text
+    assert 'pricing_price_lookups_total{outcome="miss"} 1' in text
+    assert 'pricing_http_request_duration_seconds_bucket{route="/get-price",le="0.0001"} 2' in text
+    assert 'pricing_http_request_duration_seconds_count{route="/get-price"} 3' in text
+    # Snapshot gauges only for live processes
+    assert f'pricing_snapshot_info{{pid="{os.getpid()}",version="{store.data["version"]}"}} 1' in text
+    assert f'pid="{pid}"' not in text
+    
+    # Once it exits, its file is deleted and its counts leave the totals
+    os.write(done_write, b'1')
+    os.waitpid(pid, 0)
+    text = metrics.render().decode()
+    assert 'pricing_price_lookups_total{outcome="hit"} 1' in text
+    assert os.listdir(tmp_path) == [os.path.basename(metrics.path)]
+    
+    # A file left under this pid by an exited process starts from zeros
+    stale = tmp_path / 'stale'
+    stale.mkdir()
+    (stale / f'{metrics.name}-{os.getpid()}.metrics').write_bytes(b'\x01' * metrics.file_size)
+    fresh = Metrics(['/get-price', '/health'], directory=str(stale))
+    fresh.observe_request('/get-price', 200, 0.00004)
+    assert 'pricing_price_lookups_total{outcome="hit"} 1' in fresh.render().decode()
+    
+    response = app.test_client().get('/metrics')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    assert b'pricing_price_lookups_total' in response.data
+    
+    print("✅ Metrics aggregated across processes")
+
+def test_loadtest_traffic(tmp_path):
+    """Synthetic and replayed traffic for the load-test harness, and its percentile maths"""
+    from loadtest import load_catalog, parse_mix, percentile, replay_requests, summarize, synthetic_requests
+    
+    catalog = load_catalog()
+    traffic = synthetic_requests(catalog, 500, parse_mix('hit=80,typo=10,miss=5,catalog=5'), seed=1)
+    assert len(traffic) == 500
+    assert traffic == synthetic_requests(catalog, 500, parse_mix('hit=80,typo=10,miss=5,catalog=5'), seed=1)
+    hits = [body for method, path, body in traffic if path == '/get-price' and
+            (body['FuelType'], body['CarManufacturer'], body['CarModel']) in set(catalog)]
+    assert 300 < len(hits) < 480
+    
+    log = tmp_path / 'requests.log.jsonl'
+    log.write_text(
+        '{"CarManufacturer": "Maruti", "CarModel": "Swift", "FuelType": "petrol"}\n'
+        '{"method": "get", "path": "/get-brands"}\n'
+        'not json\n'
+    )
+    assert replay_requests(str(log)) == [
+        ('POST', '/get-price', {"CarManufacturer": "Maruti", "CarModel": "Swift", "FuelType": "petrol"}),
+        ('GET', '/get-brands', None)
+    ]
+    
+    values = [i / 1000 for i in range(1, 101)]
+    assert percentile(values, 0.5) == 0.05 and percentile(values, 0.99) == 0.099
+    summary = summarize([('POST /get-price', 200, v) for v in values], elapsed=2.0)
+    assert summary['ALL']['throughput_rps'] == 50.0 and summary['POST /get-price']['p95_ms'] == 95.0
+    
+    print("✅ Load-test traffic generation and percentiles")
+
+def test_benchmark_statistics():
+    """Benchmark runner calibrates loops, reports per-call stats and flags regressions"""
+    from benchmark import compare, measure
+    
+    result = measure(lambda: sum(range(100)), repeat=3, min_time=0.001)
+    assert result['loops'] >= 1 and result['repeat'] == 3
+    assert 0 < result['min_us'] <= result['median_us']
+    
+    baseline = {"meta": {}, "results": {"fast": {"median_us": 10.0}, "slow": {"median_us": 10.0}}}
+    current = {"fast": {"median_us": 10.5}, "slow": {"median_us": 12.0}, "new": {"median_us": 1.0}}
+    assert compare(current, baseline, threshold=0.10) == ["slow"]
+    
+    print("✅ Benchmark statistics and regression check")
+
+def test_canonical_names():
+    """Punctuation, spacing, accents and curated aliases resolve to exact hits, in every backend"""
+    from app_optimized import app, store
+    from pricing_backends import create_backend
+    from pricing_index import build_name_aliases, canonical
+    from pricing_store import price_key
+
+    assert canonical("Alto K-10") == canonical("alto  k10") == "altok10"
+    assert canonical("Citroën") == "citroen"
+
+    client = app.test_client()
+    expected = client.post('/get-price', json={"CarManufacturer": "Maruti", "CarModel": "Swift Dzire", "FuelType": "petrol"}).data
+    for brand, model in [("Maruti", "Swift  Dzire"), ("maruti suzuki", "swift-dzire"), ("MARUTI", "Dzire")]:
+        response = client.post('/get-price', json={"CarManufacturer": brand, "CarModel": model, "FuelType": "Petrol / CNG"})
+        assert response.status_code == 200 and response.data == expected, (brand, model)
+
+    snapshot = store.data
+    backends = [create_backend(name, snapshot) for name in ('index', 'list', 'pandas')]
+    for brand, model, fuel in [("Maruti", "Alto K-10", "petrol"), ("Maruti", "A Star", "petrol"),
+                               ("Hyundai", "i-20", "diesel"), ("VW", "Polo", "diesel")]:
+        key = price_key(snapshot, {"CarManufacturer": brand, "CarModel": model, "FuelType": fuel})
+        assert key in snapshot['index'], key
+        assert all(backend.response(key) == backends[0].response(key) for backend in backends)
+
+    # Aliases never shadow a real entry and never point at a missing one
+    aliases = build_name_aliases({('petrol', 'maruti', 'dzire'): {}, ('petrol', 'maruti', 'swiftdzire'): {}})
+    assert ('maruti', 'dzire') not in aliases and ('maruti', 'k10') not in aliases
+    print(f"✅ {len(snapshot['name_aliases'])} aliases and canonical spellings resolve to exact hits")
+
+def test_backends_agree():
+    """Every lookup backend gives the same answers, and every app serves them"""
+    import app as pandas_app
+    import app_simple
+    from app_optimized import app, store
+    from pricing_backends import create_backend
+    from pricing_index import make_key
+    
+    snapshot = store.data
+    backends = [create_backend(name, snapshot) for name in ('index', 'list', 'pandas')]
+    requests_to_check = [
+        ("petrol", "Maruti", "Swift"), ("CNG", "maruti", "swift"), ("Diesel", "Hyundai", "Creta"),
+        ("petrol", "Maruti", "Swfit"), ("hydrogen", "Maruti", "Swift"), ("Diesel", "  HYUNDAI ", "i20")
+    ]
+    for fuel, brand, model in requests_to_check:
+        key = make_key(snapshot['fuel_aliases'], fuel, brand, model)
+        answers = [backend.response(key) for backend in backends]
+        assert all(answer == answers[0] for answer in answers), (fuel, brand, model)
+    assert backends[2].responses([key, key]) == [answers[0]] * 2
+    
+    payload = {"CarManufacturer": "Maruti", "CarModel": "Swift", "FuelType": "petrol"}
+    expected = app.test_client().post('/get-price', json=payload).data
+    for module in (pandas_app, app_simple):
+        assert module.app.test_client().post('/get-price', json=payload).data == expected
+        assert module.app.test_client().get('/get-brands').data == app.test_client().get('/get-brands').data
+    for path, body in (('/get-models', {"CarManufacturer": "Maruti"}),
+                       ('/get-models', {"CarManufacturer": "Hyundai", "FuelType": "diesel"}),
+                       ('/get-models', {"CarManufacturer": "VW", "FuelType": "hydrogen"}),
+                       ('/get-models', {"CarManufacturer": ""}), ('/get-models', ["Maruti"]),
+                       ('/get-price', ["Maruti", "Swift", "petrol"]), ('/get-price', "Maruti Swift")):
+        expected = app.test_client().post(path, json=body)
+        for module in (pandas_app, app_simple):
+            response = module.app.test_client().post(path, json=body)
+            assert (response.status_code, response.data) == (expected.status_code, expected.data), (path, body)
+    
+    try:
+        create_backend('sqlite', snapshot)
+        assert False, "unknown backend accepted"
+    except ValueError:
+        pass
+    
+    print("✅ index, list and pandas backends agree")
+
+def test_pandas_bulk_lookup():
+    """The pandas backend probes a sorted key index, and prices a DataFrame of queries in one merge"""
+    import pandas as pd
+    from app_optimized import store
+    from pricing_backends import create_backend
+    from pricing_store import resolve_price
+    
+    snapshot = store.data
+    backend = create_backend('pandas', snapshot)
+    assert backend.frame.index.is_monotonic_increasing and backend.frame.index.is_unique
+    
+    queries = pd.DataFrame([
+        {"FuelType": "petrol", "CarManufacturer": "Maruti", "CarModel": "Swift"},
+        {"FuelType": "CNG", "CarManufacturer": "  MARUTI ", "CarModel": "alto k-10"},
+        {"FuelType": "Diesel", "CarManufacturer": "Hyundai", "CarModel": "i20"},
+        {"FuelType": "petrol", "CarManufacturer": "Maruti", "CarModel": "Swfit"},
+        {"FuelType": "hydrogen", "CarManufacturer": "Maruti", "CarModel": "Swift"},
+        {"FuelType": None, "CarManufacturer": "Maruti", "CarModel": "Swift"},
+    ])
+    priced = backend.lookup_frame(queries)
+    assert list(priced.index) == list(queries.index)
+    for (_, query), (_, row) in zip(queries.iterrows(), priced.iterrows()):
+        item = {field: value if isinstance(value, str) else '' for field, value in query.items()}
+        status, result = resolve_price(snapshot, item) if all(item.values()) else (400, None)
+        assert row['matched'] == (status == 200), item
+        if status == 200:
+            expected = json.loads(result[0])['data']
+            assert row['original_model'] == expected['car_details']['model']
+            assert str(row['periodic_service']) == expected['service_prices']['periodic_service']['price']
+    
+    keys = list(snapshot['index'])[:50] + [('petrol/cng', 'maruti', 'nosuchcar'), (None, 'maruti', 'swift')]
+    assert backend.responses(keys) == [snapshot['responses'].get(key) for key in keys]
+    
+    print(f"✅ pandas backend priced {int(priced['matched'].sum())}/{len(queries)} queries in one merge")
+
+def test_pricing_compiler(tmp_path):
+    """The compiler reports duplicates and #N/A cells, skips unchanged sheets and never half-writes"""
+    from pricing_compiler import compile_pricing
+    from pricing_store import PricingStore
+
+    header = "FuelType,Car Brand,Car Model,Periodic Service Price GaadiMech,Express Service Price GaadiMech,Discounted Price,Comprehensive Service Price GaadiMech,Dent & Paint Price GaadiMech,Dent and Paint Full Body\n"
+    csv_file = tmp_path / 'sheet.csv'
+    data_file = tmp_path / 'pricing_data.json'
+    csv_file.write_text(header +
+        "petrol,Maruti,Swift,2599,2899,2399,3399,#N/A,20000\n"
+        "petrol,Maruti,Swift,2699,2899,2399,3399,1699,20000\n"
+        "petrol,maruti,swift ,2799,2899,2399,3399,1699,20000\n"
+        "diesel,Hyundai,Creta,3599,3899,3399,4399,#N/A,\n")
+
+    result, report = compile_pricing(str(csv_file), str(data_file))
+    assert report.written and report.rows == 4 and result['total_records'] == 2
+    assert [exact for _, _, _, exact in report.duplicates] == [True, False]
+    assert report.not_available == 2
+    assert result['data']['Petrol/CNG']['maruti']['swift ']['periodic_service'] == 2799
+    assert result['fuel_types'] == ['Diesel', 'Petrol/CNG']
+
+    # Unchanged sheet: nothing rewritten, so workers don't reload
+    mtime = os.path.getmtime(data_file)
+    _, report = compile_pricing(str(csv_file), str(data_file))
+    assert not report.written and report.reused == 4
+    assert os.path.getmtime(data_file) == mtime
+
+    # Swapped header columns change every record even though no row did
+    swapped = header.replace("Periodic Service Price GaadiMech,Express Service Price GaadiMech",
+                             "Express Service Price GaadiMech,Periodic Service Price GaadiMech")
+    csv_file.write_text(swapped + csv_file.read_text().split("\n", 1)[1])
+    result, report = compile_pricing(str(csv_file), str(data_file))
+    assert report.written and report.reused == 0
+    assert result['data']['Petrol/CNG']['maruti']['swift ']['periodic_service'] == 2899
+
+    # A data file edited after the compile (e.g. by update_ev_dent_paint.py) is not overwritten
+    edited = json.loads(data_file.read_text())
+    edited['data']['Diesel']['hyundai']['creta']['periodic_service'] -= 500
+    data_file.write_text(json.dumps(edited))
+    csv_file.write_text(csv_file.read_text() + "diesel,Tata,Nexon,3599,3899,3399,4399,1999,\n")
+    result, report = compile_pricing(str(csv_file), str(data_file))
+    assert result is None and 'hyundai / creta' in report.errors[0]
+    assert json.loads(data_file.read_text()) == edited
+    result, report = compile_pricing(str(csv_file), str(data_file), force=True)
+    assert report.written and result['data']['Diesel']['hyundai']['creta']['periodic_service'] == 3899
+
+    # The committed data is what the sheet compiles to, fuel renames included
+    with open('pricing_data.json', 'r') as f:
+        committed = json.load(f)['data']
+    assert compile_pricing(data_file=str(tmp_path / 'sheet.json'))[0]['data'] == committed
+
+    # Strict mode refuses the duplicates and leaves the last good file alone
+    contents = data_file.read_text()
+    result, report = compile_pricing(str(csv_file), str(data_file), strict=True, force=True)
+    assert result is None and report.errors and data_file.read_text() == contents
+
+    # A corrupt data file at boot leaves the store empty instead of crashing the worker
+    data_file.write_text('{"data": ')
+    store = PricingStore(data_file=str(data_file))
+    assert store.data is None
+
+    # An empty one is recompiled from the CSV
+    empty_file = tmp_path / 'empty.json'
+    empty_file.write_text('')
+    store = PricingStore(data_file=str(empty_file))
+    assert store.data and store.data['total_records'] > 0
+
+    print(f"✅ Compiler flagged {len(report.duplicates)} duplicates and skipped an unchanged sheet")
+
+def test_pricing_rules(tmp_path):
+    """Rules stack over the sheet at load time, reach every structure and reload when edited"""
+    import shutil
+    from app_optimized import store
+    from pricing_rules import load_rules
+    from pricing_store import PricingStore, resolve_price
+
+    data_file = tmp_path / 'pricing_data.json'
+    rules_file = tmp_path / 'pricing_rules.txt'
+    shutil.copy('pricing_data.json', data_file)
+    rules_file.write_text(
+        "# EV discount, then a BMW uplift\n"
+        "fuel=EV: dent_paint -= 500, dent_paint -= 100000, floor 0\n"
+        "brand=BMW: periodic_service *= 1.05\n"
+        "fuel=petrol, brand=maruti, model=swift: periodic_service = 1000, periodic_service += 1\n"
+        "brand=VW: express_service = 4321\n"
+        "brand=Maruti Suzuki, model=Dzire: express_service = 1234\n"
+    )
+
+    base = store.data['index']
+    ruled = PricingStore(data_file=str(data_file), rules_file=str(rules_file))
+    index = ruled.data['index']
+    ev_keys = [key for key in index if key[0] == 'ev']
+    bmw_key = next(key for key in index if key[1] == 'bmw' and base[key]['periodic_service'])
+    swift_key = ('petrol/cng', 'maruti', 'swift')
+    assert all(index[key]['dent_paint'] in (0, None) for key in ev_keys)
+    assert index[bmw_key]['periodic_service'] == round(base[bmw_key]['periodic_service'] * 1.05)
+    assert index[swift_key]['periodic_service'] == 1001
+    assert base[swift_key]['periodic_service'] != 1001
+
+    # Brand and model aliases select the same cars a request with them would price
+    vw_keys = [key for key in index if key[1] == 'volkswagen']
+    dzire_keys = [key for key in index if key[1:] == ('maruti', 'swiftdzire')]
+    assert vw_keys and all(index[key]['express_service'] == 4321 for key in vw_keys)
+    assert dzire_keys and all(index[key]['express_service'] == 1234 for key in dzire_keys)
+
+    # Bodies are rendered after the rules, so the served price matches the record
+    body = json.loads(ruled.data['responses'].get(swift_key)[0])
+    assert body['data']['service_prices']['periodic_service']['price'] == "1001"
+    assert ruled.data['version'] != store.data['version']
+
+    # Editing the rules file is enough to trigger a reload
+    rules_file.write_text("brand=BMW: periodic_service += 1\n")
+    ruled.check_interval, ruled.next_check = 0.01, 0
+    ruled.maybe_reload()
+    for _ in range(100):
+        if ruled.data['index'][swift_key]['periodic_service'] != 1001:
+            break
+        time.sleep(0.05)
+    assert ruled.data['index'][swift_key]['periodic_service'] == base[swift_key]['periodic_service']
+
+    for bad in ("brand=BMW periodic_service += 1", "colour=red: dent_paint -= 1", "brand=BMW: paint -= 1"):
+        rules_file.write_text(bad + "\n")
+        try:
+            load_rules(str(rules_file))
+            assert False, bad
+        except ValueError as e:
+            assert "line 1" in str(e)
+
+    # A worker booting with a broken rules file still serves the sheet's prices
+    rules_file.write_text("brand=BMW: periodic_service += 1\nbrand=BMW periodic_service += 1\n")
+    booted = PricingStore(data_file=str(data_file), rules_file=str(rules_file))
+    assert booted.data is not None
+    assert booted.data['index'][bmw_key]['periodic_service'] == base[bmw_key]['periodic_service']
+    status, _ = resolve_price(booted.data, {"FuelType": "Petrol", "CarManufacturer": "Maruti", "CarModel": "Swift"})
+    assert status == 200
+
+    print(f"✅ Rules repriced {len(ev_keys)} EVs without touching pricing_data.json")
+
+def test_request_log(tmp_path):
+    """/get-price calls land in the JSONL log off the request path; a full queue drops and counts"""
+    import glob
+    import app_optimized
+    from loadtest import replay_requests
+    from request_log import RequestLog
+
+    original_log = app_optimized.request_log
+    app_optimized.request_log = RequestLog(directory=str(tmp_path / 'app'), flush_interval=0.05)
+    try:
+        client = app_optimized.app.test_client()
+        client.post('/get-price', json={"CarManufacturer": "maruti ", "CarModel": "SWIFT", "FuelType": "cng"})
+        client.post('/get-price', json={"CarManufacturer": "Maruti", "CarModel": "Swfit", "FuelType": "petrol"})
+        client.post('/get-price', json={"CarManufacturer": "Maruti"})
+        app_optimized.request_log.flush()
+        health = client.get('/health').get_json()['request_log']
+    finally:
+        app_optimized.request_log = original_log
+
+    [path] = glob.glob(str(tmp_path / 'app' / '*.jsonl'))
+    with open(path) as f:
+        hit, miss, invalid = [json.loads(line) for line in f]
+    assert hit['normalized'] == hit['matched'] == ["petrol/cng", "maruti", "swift"]
+    assert hit['outcome'] == "hit" and hit['data_version'] == app_optimized.store.data['version']
+    assert miss['matched'] is None and miss['status'] == 404 and miss['CarModel'] == "Swfit"
+    assert invalid['outcome'] == "invalid" and invalid['normalized'] is None
+    assert health['written'] == 3 and health['dropped'] == 0
+    assert len(replay_requests(path)) == 3
+
+    # A stalled writer: the queue fills and further calls are dropped, not blocked
+    log = RequestLog(directory=str(tmp_path / 'stalled'), queue_size=2, flush_interval=0.01, max_bytes=1)
+    with log.write_lock:
+        log.record({}, 400, None, 0.001)
+        time.sleep(0.2)
+        started = time.perf_counter()
+        for _ in range(4):
+            log.record({}, 400, None, 0.001)
+        assert time.perf_counter() - started < 0.1
+        assert log.dropped == 2
+    log.flush()
+    assert log.written == 3
+    # max_bytes=1: every batch after the first rolls over to the next part
+    assert len(glob.glob(str(tmp_path / 'stalled' / '*.jsonl'))) >= 2
+
+    # Retention: only the newest max_files files survive, and the live one is never removed
+    log = RequestLog(directory=str(tmp_path / 'retained'), flush_interval=0.01, max_bytes=1, max_files=2)
+    for _ in range(5):
+        log.record({}, 400, None, 0.001)
+        log.flush()
+    paths = sorted(glob.glob(str(tmp_path / 'retained' / '*.jsonl')))
+    assert len(paths) == 2 and log.path_for(log.stamp, log.part) in paths
+    # Off unless REQUEST_LOG_DIR is set
+    assert RequestLog().enabled == bool(os.environ.get('REQUEST_LOG_DIR'))
+
+    print(f"✅ Request log wrote {health['written']} entries and dropped {log.dropped} when full")
+
+def test_miss_tracker(tmp_path):
+    """Missed keys are counted in fixed memory, merged across processes and served to admins"""
+    import app_asgi
+    import app_common
+    import app_optimized
+    from miss_tracker import FILE_SIZE, MissTracker
+
+    tracker = MissTracker(directory=str(tmp_path))
+    # Far more distinct keys than candidate slots, then one heavy hitter
+    for i in range(2000):
+        tracker.observe(('petrol/cng', 'maruti', f'model {i}'))
+    for _ in range(50):
+        tracker.observe(('petrol/cng', 'maruti', 'alto k-10'))
+
+    ready_read, ready_write = os.pipe()
+    done_read, done_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        for _ in range(30):
+            tracker.observe((None, 'tesla', 'model 3'))
+        tracker.observe(('petrol/cng', 'maruti', 'alto k-10'))
+        os.write(ready_write, b'1')
+        os.read(done_read, 1)
+        os._exit(0)
+    os.read(ready_read, 1)
+
+    top = tracker.top(2)
+    assert top['workers'] == 2 and top['total_misses'] == 2081
+    assert [(m['brand'], m['model']) for m in top['misses']] == [('maruti', 'alto k-10'), ('tesla', 'model 3')]
+    assert top['misses'][0]['count'] >= 51 and top['misses'][1]['fuel_type'] is None
+    assert all(os.path.getsize(tmp_path / name) == FILE_SIZE for name in os.listdir(tmp_path))
+
+    # An exited worker's file is deleted with its counts
+    os.write(done_write, b'1')
+    os.waitpid(pid, 0)
+    assert tracker.top(2)['workers'] == 1 and len(os.listdir(tmp_path)) == 1
+
+    original_trackers = app_optimized.misses, app_asgi.misses
+    original_token = app_common.ADMIN_TOKEN
+    # Both apps count into the same directory, as they would on one host
+    app_optimized.misses = MissTracker(directory=str(tmp_path / 'app'))
+    app_asgi.misses = MissTracker(directory=str(tmp_path / 'app'))
+    app_common.ADMIN_TOKEN = 'secret'
+    try:
+        client = app_optimized.app.test_client()
+        client.post('/get-price', json={"CarManufacturer": "Maruti", "CarModel": "Swfit", "FuelType": "petrol"})
+        client.post('/get-prices', json=[{"CarManufacturer": "Maruti", "CarModel": "swfit ", "FuelType": "cng"}])
+        call_asgi(app_asgi.app, 'POST', '/get-price', {"CarManufacturer": "Maruti", "CarModel": "SWFIT", "FuelType": "petrol"})
+        assert client.get('/admin/misses').status_code == 403
+        assert call_asgi(app_asgi.app, 'GET', '/admin/misses')[0] == 403
+        data = client.get('/admin/misses?limit=5', headers={'X-Admin-Token': 'secret'}).get_json()
+        status, _, body = call_asgi(app_asgi.app, 'GET', '/admin/misses?limit=5', headers=[(b'x-admin-token', b'secret')])
+        assert status == 200 and json.loads(body) == data
+        assert call_asgi(app_asgi.app, 'GET', '/admin/misses?limit=x', headers=[(b'x-admin-token', b'secret')])[0] == 400
+    finally:
+        app_optimized.misses, app_asgi.misses = original_trackers
+        app_common.ADMIN_TOKEN = original_token
+    assert data['misses'] == [{"fuel_type": "petrol/cng", "brand": "maruti", "model": "swfit", "count": 3}]
+
+    print(f"✅ Miss tracker ranked {top['misses'][0]['model']} first out of {top['total_misses']} misses")
+
+def test_admission(tmp_path):
+    """Bursts past the concurrency limit or a client's bucket are shed fast, with state shared across workers"""
+    import app_optimized
+    from admission import Admission, client_key, parse_request_start
+
+    admission = Admission(directory=str(tmp_path), max_in_flight=2, max_queue_ms=1000, client_rate=1, client_burst=2)
+    now = 1000.0
+    assert admission.admit('sender:a', now=now) is None
+    assert admission.admit('sender:a', now=now) is None
+    assert admission.admit('sender:b', now=now) == (503, 1, 'concurrency')
+    admission.release()
+    admission.release()
+    # The burst is spent; the bucket refills at one token a second
+    assert admission.admit('sender:a', now=now + 0.5) == (429, 1, 'client_rate')
+    assert admission.admit(None, request_start=now - 5, now=now) == (503, 1, 'queue_time')
+
+    # Another worker sees the same in-flight total and the same buckets
+    assert admission.admit('sender:b', now=now) is None
+    pid = os.fork()
+    if pid == 0:
+        in_flight = admission.in_flight()
+        shed = admission.admit('sender:a', now=now + 0.6)
+        os._exit(0 if in_flight == 1 and shed == (429, 1, 'client_rate') else 1)
+    assert os.waitpid(pid, 0)[1] == 0
+    admission.release()
+    assert admission.admit('sender:a', now=now + 1.5) is None
+    admission.release()
+
+    # The exited worker's slot no longer counts
+    stats = admission.stats()
+    assert stats['in_flight'] == 0 and stats['admitted'] == 4
+    assert stats['shed'] == {'queue_time': 1, 'concurrency': 1, 'client_rate': 1}
+    assert b'pricing_admission_requests_total{result="client_rate"} 1' in admission.render()
+
+    # Workers racing for the last places never overshoot the limit
+    racing = Admission(directory=str(tmp_path / 'race'), max_in_flight=10, client_rate=0)
+    ready_read, ready_write = os.pipe()
+    done_read, done_write = os.pipe()
+    children = []
+    for _ in range(4):
+        pid = os.fork()
+        if pid == 0:
+            for _ in range(20):
+                racing.admit(now=now)
+            os.write(ready_write, b'1')
+            os.read(done_read, 1)
+            os._exit(0)
+        children.append(pid)
+    for _ in children:
+        os.read(ready_read, 1)
+    assert racing.in_flight() == 10 and racing.stats()['shed']['concurrency'] == 70
+    os.write(done_write, b'1' * len(children))
+    for pid in children:
+        os.waitpid(pid, 0)
+    assert Admission(directory=str(tmp_path)).max_queue_seconds == 1.5
+
+    assert parse_request_start('t=1700000000123') == 1700000000.123
+    assert client_key(None, '6.6.6.6, 10.0.0.1', '10.0.0.2', key_by_ip=True) == 'ip:10.0.0.1'
+    assert client_key(' 919800000000 ', key_by_ip=True) == 'sender:919800000000'
+    assert client_key(None, remote_addr='10.0.0.2') is None
+
+    original = app_optimized.admission
+    app_optimized.admission = Admission(directory=str(tmp_path / 'app'), client_rate=1, client_burst=1)
+    try:
+        client = app_optimized.app.test_client()
+        item = {"CarManufacturer": "Maruti", "CarModel": "Swift", "FuelType": "Petrol", "waId": "919800000000"}
+        assert client.post('/get-price', json=item).status_code == 200
+        response = client.post('/get-price', json=item)
+        assert response.status_code == 429 and int(response.headers['Retry-After']) >= 1
+        assert response.get_json()['error'] == "Too many requests"
+        assert client.post('/get-price', json={**item, "waId": "919811111111"}).status_code == 200
+        assert client.get('/health').get_json()['admission']['in_flight'] == 0
+    finally:
+        app_optimized.admission = original
+
+    print("✅ Admission control sheds bursts with Retry-After")
+
+def test_startup_report(tmp_path):
+    """A lazy boot defers the optional parts to first use and reports time per phase"""
+    import app_optimized
+    from pricing_store import PricingStore, resolve_price
+    from startup import StartupReport
+
+    started = time.perf_counter()
+    report = StartupReport(started, budget_ms=60000)
+    report.mark('imports')
+    store = PricingStore(check_interval=0, backend='pandas', warm=False)
+    report.mark_store(store)
+    report.finish()
+
+    snapshot = store.data
+    assert {'backend', 'suggester', 'autocomplete', 'export'} <= set(snapshot['deferred'])
+    assert 'backend' not in snapshot and snapshot['phases']['cache_warm'] == 0.0
+    # The pandas backend (and its import) is built by the first lookup
+    status, _ = resolve_price(snapshot, {"CarManufacturer": "Maruti", "CarModel": "Swift", "FuelType": "Petrol"})
+    assert status == 200 and 'backend' in snapshot and 'suggester' not in snapshot
+
+    phases = report.as_dict()['phases_ms']
+    assert list(phases) == ['imports', 'snapshot_load', 'index_build', 'cache_warm', 'store', 'app_setup']
+    assert abs(sum(phases.values()) - report.as_dict()['total_ms']) < 1
+
+    # Reloads build everything: they run off the request path
+    assert store.reload() and not store.data['deferred'] and store.data['phases']['cache_warm'] > 0
+
+    health = app_optimized.app.test_client().get('/health').get_json()
+    assert health['startup']['total_ms'] > 0 and 'imports' in health['startup']['phases_ms']
+
+    print(f"✅ Startup report: {report.as_dict()['total_ms']}ms, {len(phases)} phases")
+
 def test_api_endpoints():
     """Test API endpoints if server is running"""
     base_url = "http://localhost:5000"